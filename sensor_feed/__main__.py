@@ -5,7 +5,7 @@ import logging
 from sensor_feed import __version__
 from sensor_feed.feed import SensorFeed
 from sensor_feed.config import SensorConfig
-from sensor_feed.plant_control import PlantControl
+from sensor_feed.scheduler import Scheduler
 
 
 LOGGER = logging.getLogger(__name__)
@@ -24,6 +24,59 @@ def get_parser():
 
     parser.add_argument('--config', help='YAML config file', default=None)
 
+    parser.add_argument('--dispatch', default='event', choices=['event', 'poll'],
+                        help="how the feed waits for sensor data: 'event' passes "
+                             "data to sinks as soon as it arrives, 'poll' checks "
+                             "every few seconds. Default is event")
+
+    parser.add_argument('--workers', default=4, type=int,
+                        help="number of worker threads used to read sensors, "
+                             "0 starts a thread per sensor. Default is 4")
+
+    parser.add_argument('--queue-size', default=10000, type=int,
+                        help="maximum number of sensor values waiting for the "
+                             "sinks, 0 for no limit. Default is 10000")
+
+    parser.add_argument('--overflow', default='drop-oldest',
+                        choices=['block', 'drop-oldest', 'drop-newest'],
+                        help="what to do with sensor values when --queue-size is "
+                             "reached: 'block' makes sensors wait, 'drop-oldest' "
+                             "and 'drop-newest' discard values. Default is "
+                             "drop-oldest")
+
+    parser.add_argument('--fanout', default='serial', choices=['serial', 'parallel'],
+                        help="how data is passed to sinks: 'serial' calls each in "
+                             "turn, 'parallel' runs each sink on its own thread. "
+                             "Default is serial")
+
+    parser.add_argument('--metrics-period', default=None, type=float,
+                        help="seconds between logging metrics (at INFO level, "
+                             "-vvv) while running. Metrics are always logged "
+                             "on shutdown")
+
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.add_parser('run', help='run the feed, the default')
+
+    bench_parser = subparsers.add_parser(
+        'bench', help='benchmark the configured feed using stand-in sensors'
+    )
+    bench_parser.add_argument('--duration', default=60, type=float,
+                              help="seconds of sensor time to run for, default is 60")
+    bench_parser.add_argument('--speedup', default=1, type=float,
+                              help="run this many times faster than real time by "
+                                   "shortening the sensor periods. Default is 1")
+    bench_parser.add_argument('--sinks', default=None,
+                              help="comma separated benchmark sinks (null, logging, "
+                                   "dataframe, aggregate, sqlite, parquet, phildb, "
+                                   "mqtt) to use instead of the configured sinks")
+    bench_parser.add_argument('--mqtt-broker', default=None,
+                              help='MQTT broker for the mqtt benchmark sink, and '
+                                   'for configured MQTT sinks to publish to under '
+                                   'a benchmark topic rather than being skipped')
+    bench_parser.add_argument('--use-configured-sinks', action='store_true',
+                              help="write to the configured sinks' real files and "
+                                   "brokers rather than temporary stand-ins")
+
     return parser
 
 
@@ -35,6 +88,15 @@ def main(args=None):
     log_level = (5 - args.verbose) * 10
     logging.basicConfig(level=log_level, format='%(asctime)s: %(message)s')
 
+    if args.command == 'bench':
+        # only needed (along with numpy) for benchmarking
+        from sensor_feed.bench import bench_config
+        print(bench_config(args))
+        return
+
+    # needs the Raspberry Pi GPIO library, so not imported for benchmarking
+    from sensor_feed.plant_control import PlantControl
+
     # Create sensor and sink objects.
     config = SensorConfig(args.config)
     sensors = config.sensors()
@@ -45,7 +107,14 @@ def main(args=None):
     sinks.append(plant)
 
     # Create the feed
-    feed = SensorFeed(sensors, sinks, args.sensor_period)
+    scheduler = None
+    if args.workers > 0:
+        scheduler = Scheduler(max_workers=args.workers)
+    feed = SensorFeed(sensors, sinks, args.sensor_period,
+                      dispatch=args.dispatch, scheduler=scheduler,
+                      fanout=args.fanout, queue_size=args.queue_size,
+                      overflow=args.overflow)
+    feed.metrics_period = args.metrics_period
 
     # Start our sensors running
     feed.start_sensors()
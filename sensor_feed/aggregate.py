@@ -0,0 +1,144 @@
+"""
+Streaming aggregation of sensor data.
+
+An ``AggregatingSink`` sits in front of another sink and passes it only
+summary statistics of each parameter over tumbling windows, e.g. the
+mean, min and max of each minute of 1 second readings.
+"""
+from collections import namedtuple
+import logging
+
+from sensor_feed.record import Sample, get_param_name, register_param
+from sensor_feed.sink import Sink
+
+
+LOGGER = logging.getLogger(__name__)
+
+#: Statistics that can be calculated over each window.
+STATS = ('min', 'max', 'mean', 'count', 'last')
+
+#: Description of an aggregated parameter, standing in for a sensor when
+#: initialising the downstream sink. Windows are always aligned.
+AggregateParam = namedtuple('AggregateParam',
+                            ['param_name', 'dtype', 'period', 'aligned'],
+                            defaults=[True])
+
+
+class Window:
+    """Running statistics of the values in one window."""
+    __slots__ = ('start', 'min', 'max', 'total', 'count', 'last')
+
+    def __init__(self, start, value):
+        self.start = start
+        self.min = value
+        self.max = value
+        self.total = value
+        self.count = 1
+        self.last = value
+
+    def add(self, value):
+        """Include ``value`` in the statistics."""
+        if value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+        self.total += value
+        self.count += 1
+        self.last = value
+
+    @property
+    def mean(self):
+        return self.total / self.count
+
+
+class AggregatingSink(Sink):
+    """
+        Sink passing statistics over tumbling windows on to ``sink``.
+
+        Windows are ``window`` seconds long, aligned to multiples of
+        ``window`` since the epoch. Each of ``stats`` is passed on for each
+        parameter as ``<param_name>_<stat>``, timestamped with the start of
+        the window.
+
+        A window is complete, and passed on, when the first value of a
+        later window arrives for the parameter (or when the sink is
+        finalised). Values arriving for an earlier window are counted in
+        ``late`` and ignored.
+    """
+    def __init__(self, sink, window=60, stats=STATS):
+        unknown = set(stats) - set(STATS)
+        if unknown:
+            raise ValueError("Unknown statistics: %s" % ', '.join(sorted(unknown)))
+        self.sink = sink
+        self.window = window
+        self.stats = tuple(stats)
+        self.late = 0
+        self._window_nanos = round(window * 1e9)
+        # current Window for each sensor id
+        self._windows = {}
+        # (stat, output id) pairs for each sensor id
+        self._outputs = {}
+
+    def initialise(self, sensors):
+        """Initialise ``sink`` with the aggregated parameters."""
+        self.sink.initialise([
+            AggregateParam(
+                '%s_%s' % (sensor.param_name, stat),
+                int if stat == 'count' else float if stat == 'mean' else sensor.dtype,
+                self.window,
+            )
+            for sensor in sensors for stat in self.stats
+        ])
+
+    def process_value(self, param_name, timestamp, value):
+        """Handle a single datapoint."""
+        self.process_batch([Sample.from_value(param_name, timestamp, value)])
+
+    def process_batch(self, records):
+        """Update the windows, passing any completed ones on."""
+        completed = []
+        windows = self._windows
+        nanos = self._window_nanos
+        for sensor_id, ts, value in records:
+            start = ts - ts % nanos
+            window = windows.get(sensor_id)
+            if window is None:
+                windows[sensor_id] = Window(start, value)
+            elif start == window.start:
+                window.add(value)
+            elif start > window.start:
+                self._complete(sensor_id, window, completed)
+                windows[sensor_id] = Window(start, value)
+            else:
+                self.late += 1
+
+        if completed:
+            self.sink.process_batch(completed)
+
+    def _complete(self, sensor_id, window, completed):
+        """Add the statistics for ``window`` to ``completed``."""
+        try:
+            outputs = self._outputs[sensor_id]
+        except KeyError:
+            param_name = get_param_name(sensor_id)
+            outputs = self._outputs[sensor_id] = tuple(
+                (stat, register_param('%s_%s' % (param_name, stat)))
+                for stat in self.stats
+            )
+        for stat, output_id in outputs:
+            completed.append(Sample(output_id, window.start,
+                                    getattr(window, stat)))
+
+    def finalise(self):
+        """Pass on the incomplete windows and finalise ``sink``."""
+        completed = []
+        for sensor_id, window in self._windows.items():
+            self._complete(sensor_id, window, completed)
+        self._windows = {}
+        if self.late:
+            LOGGER.warning('Ignored %d late values', self.late)
+        try:
+            if completed:
+                self.sink.process_batch(completed)
+        finally:
+            self.sink.finalise()
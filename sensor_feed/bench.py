@@ -0,0 +1,388 @@
+"""
+End-to-end benchmarks of the sensor feed.
+
+A ``SensorFeed`` is driven by synthetic sensors and passes their readings
+to each of the built in sinks in turn. For each sink the sustained
+readings per second, the 50th and 99th percentile latency from a sensor
+being triggered to the sink having handled the reading, the CPU used and
+the peak RSS are reported. Each sink is run in a fresh process so CPU and
+RSS figures are for that sink alone. Run with::
+
+    python -m sensor_feed.bench --sensors 20 --period 0.01 --duration 10
+
+``python -m sensor_feed bench`` instead benchmarks a feed config, with
+stand-ins for its sensors (see ``bench_config``).
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import io
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from sensor_feed.aggregate import AggregatingSink
+from sensor_feed.config import SensorConfig
+from sensor_feed.feed import SensorFeed
+from sensor_feed.scheduler import Scheduler
+from sensor_feed.sensor import SleepingSensor
+from sensor_feed.sink import DataFrameSink, LoggingSink, MQTTSink, Sink
+from sensor_feed.sink_sqlite import SQLiteSink
+
+
+LOGGER = logging.getLogger(__name__)
+
+#: Sinks that are benchmarked by default, in order.
+SINKS = ('null', 'logging', 'dataframe', 'aggregate', 'sqlite', 'parquet',
+         'phildb')
+
+#: Keyword arguments of the built in sinks naming files or directories.
+PATH_KWARGS = ('dbfile', 'directory', 'spool_dir')
+
+
+class SyntheticSensor(SleepingSensor):
+    """A sensor returning a count of its readings, with no hardware delay."""
+    param_unit = '1'
+    # as in the example config
+    aligned = True
+
+    def __init__(self, name, period=None, dtype=float):
+        super(SyntheticSensor, self).__init__()
+        self.param_name = name
+        self.param_id = name
+        self.period = period
+        self.dtype = dtype
+        self._convert = int if np.dtype(dtype).kind in 'biu' else float
+        self._count = 0
+
+    def get_value(self):
+        self._count += 1
+        return self._convert(self._count)
+
+
+class NullSink(Sink):
+    """Sink that discards all data, for the cost of the feed alone."""
+    def process_value(self, param_name, timestamp, value):
+        pass
+
+    def process_batch(self, records):
+        pass
+
+
+class LatencySink(Sink):
+    """
+        Passes batches on to ``sink``, recording how long after being
+        triggered each reading was handled.
+    """
+    def __init__(self, sink):
+        self.sink = sink
+        self.params = getattr(sink, 'params', None)
+        self.queue_size = getattr(sink, 'queue_size', self.queue_size)
+        self.backpressure = getattr(sink, 'backpressure', self.backpressure)
+        self.count = 0
+        self._latencies = []
+
+    def initialise(self, sensors):
+        self.sink.initialise(sensors)
+
+    def process_batch(self, records):
+        self.sink.process_batch(records)
+        now = time.time_ns()
+        stamps = np.fromiter((sample.ts for sample in records), dtype='i8',
+                             count=len(records))
+        self._latencies.append(now - stamps)
+        self.count += len(records)
+
+    def finalise(self):
+        self.sink.finalise()
+
+    def percentiles(self, percents):
+        """Get the latency percentiles in milliseconds."""
+        if not self._latencies:
+            return [float('nan')] * len(percents)
+        return list(np.percentile(np.concatenate(self._latencies), percents) / 1e6)
+
+
+def create_sink(name, directory, mqtt_broker=None):
+    """
+        Create the sink called ``name``, with any files in ``directory``.
+
+        Raises ImportError if the sink's dependencies aren't installed.
+    """
+    if name == 'null':
+        return NullSink()
+    if name == 'logging':
+        logger = logging.getLogger('sink')
+        logger.propagate = False
+        logger.addHandler(logging.StreamHandler(open(os.devnull, 'w')))
+        return LoggingSink()
+    if name == 'dataframe':
+        return DataFrameSink()
+    if name == 'aggregate':
+        return AggregatingSink(NullSink())
+    if name == 'sqlite':
+        return SQLiteSink(os.path.join(directory, 'bench.db'))
+    if name == 'parquet':
+        from sensor_feed.sink_parquet import ParquetSink
+        return ParquetSink(os.path.join(directory, 'parquet'))
+    if name == 'phildb':
+        from sensor_feed.sink_phildb import PhilDBSink
+        return PhilDBSink(os.path.join(directory, 'phildb'))
+    if name == 'mqtt':
+        return MQTTSink(broker=mqtt_broker, topic_root='sensor-feed-bench')
+    raise ValueError("Unknown sink: %s" % name)
+
+
+def sandbox_sink_config(sink_config, directory, mqtt_broker=None):
+    """
+        Get a copy of ``sink_config`` that is safe to benchmark.
+
+        Any of ``PATH_KWARGS`` are moved into a new directory in
+        ``directory``. An MQTT sink publishes to ``mqtt_broker`` under a
+        benchmark topic, or is replaced by a ``NullSink`` if no
+        ``mqtt_broker`` is given.
+    """
+    sink_config = dict(sink_config)
+    kwargs = dict(sink_config.get('kwargs') or {})
+    if sink_config['class'].rsplit('.', 1)[-1] == 'MQTTSink':
+        if mqtt_broker is None:
+            LOGGER.info('Replacing %s with a NullSink', sink_config['class'])
+            sink_config['class'] = 'sensor_feed.bench.NullSink'
+            kwargs = {}
+        else:
+            kwargs.pop('port', None)
+            kwargs.update(broker=mqtt_broker, topic_root='sensor-feed-bench')
+    for name in PATH_KWARGS:
+        if name in kwargs:
+            kwargs[name] = os.path.join(tempfile.mkdtemp(dir=directory),
+                                        os.path.basename(kwargs[name]))
+    sink_config['kwargs'] = kwargs
+    return sink_config
+
+
+def synthetic_sensors(count, period, dtype=float):
+    """Get ``count`` sensors each reading every ``period`` seconds."""
+    return [SyntheticSensor('synthetic_%d' % idx, period, dtype)
+            for idx in range(count)]
+
+
+def sink_names(sinks):
+    """Get a unique name for each of ``sinks`` from its class."""
+    names = []
+    for sink in sinks:
+        name = type(sink).__name__
+        if name in names:
+            name = '%s_%d' % (name, len(names))
+        names.append(name)
+    return names
+
+
+def run_feed(sensors, sinks, duration, workers=4, **feed_options):
+    """
+        Run a feed of ``sensors`` into ``sinks`` for ``duration`` seconds.
+
+        ``feed_options`` are passed on to ``SensorFeed``. Returns a dict of
+        results for each sink by name (see ``sink_names``), the CPU and RSS
+        figures being for the whole feed.
+    """
+    latencies = [LatencySink(sink) for sink in sinks]
+    scheduler = Scheduler(max_workers=workers) if workers > 0 else None
+    feed = SensorFeed(sensors, latencies,
+                      min(sensor.period for sensor in sensors),
+                      scheduler=scheduler, **feed_options)
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    feed.start_sensors()
+    start = time.monotonic()
+    deadline = start + duration
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            feed.process_pending(timeout=min(remaining, 0.1))
+    finally:
+        feed.stop_sensors()
+    elapsed = time.monotonic() - start
+    feed.process_pending()
+    # sinks such as DataFrameSink print everything when finalised
+    with contextlib.redirect_stdout(io.StringIO()):
+        feed.finalise_sinks()
+    end_usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    cpu = (end_usage.ru_utime - usage.ru_utime +
+           end_usage.ru_stime - usage.ru_stime)
+    totals = {
+        'seconds': elapsed,
+        'cpu_percent': 100 * cpu / elapsed,
+        # ru_maxrss is in kB on Linux
+        'peak_rss_mb': end_usage.ru_maxrss / 1024,
+        'overruns': sum(feed.overruns().values()),
+        'dropped': sum(feed.dropped().values()),
+    }
+    results = {}
+    for name, latency in zip(sink_names(sinks), latencies):
+        p50, p99 = latency.percentiles([50, 99])
+        results[name] = dict(totals, readings=latency.count,
+                             rate=latency.count / elapsed,
+                             p50_ms=p50, p99_ms=p99)
+    return results
+
+
+def run_benchmark(sensors, sink, duration, workers=4):
+    """
+        Run a feed of ``sensors`` into ``sink`` for ``duration`` seconds.
+
+        Returns a dict of results.
+    """
+    results = run_feed(sensors, [sink], duration, workers)
+    return next(iter(results.values()))
+
+
+def run_sink(sink_name, sensor_specs, duration, workers=4, mqtt_broker=None):
+    """
+        Benchmark the sink called ``sink_name``.
+
+        ``sensor_specs`` are ``(param_name, period, dtype)`` tuples for the
+        sensors to create. Returns a dict of results.
+    """
+    directory = tempfile.mkdtemp(prefix='sensor-feed-bench-')
+    try:
+        sink = create_sink(sink_name, directory, mqtt_broker)
+        sensors = [SyntheticSensor(*spec) for spec in sensor_specs]
+        return run_benchmark(sensors, sink, duration, workers)
+    finally:
+        shutil.rmtree(directory)
+
+
+def run_isolated(sink_name, *args, **kwargs):
+    """As ``run_sink``, but in a new process."""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_sink, sink_name, *args, **kwargs).result()
+
+
+def run_sinks(sink_names, sensor_specs, duration, workers=4, mqtt_broker=None,
+              isolate=True):
+    """
+        Benchmark each of ``sink_names``.
+
+        Returns a dict of results for each sink that could be created.
+    """
+    run = run_isolated if isolate else run_sink
+    results = {}
+    for sink_name in sink_names:
+        LOGGER.info('Benchmarking %s...', sink_name)
+        try:
+            results[sink_name] = run(sink_name, sensor_specs, duration,
+                                     workers, mqtt_broker)
+        except ImportError as err:
+            LOGGER.warning('Skipping %s: %s', sink_name, err)
+    return results
+
+
+def bench_config(args):
+    """
+        Benchmark the feed configured by ``args`` (from the main parser).
+
+        Each configured sensor is replaced by a ``SyntheticSensor`` with the
+        same period, and the feed is run for ``args.duration`` seconds of
+        sensor time, ``args.speedup`` times faster than real time. The
+        configured sinks are used, with their files in a temporary
+        directory and MQTT sinks replaced (see ``sandbox_sink_config``),
+        unless ``args.use_configured_sinks`` is set. ``args.sinks`` may
+        instead name benchmark sinks to use. Returns the report.
+    """
+    config = SensorConfig(args.config)
+    specs = [(name, period / args.speedup, dtype)
+             for name, period, dtype in config.describe_sensors(args.sensor_period)]
+    for name, period, _ in specs:
+        LOGGER.info('Stand-in for %s every %gs', name, period)
+    sensors = [SyntheticSensor(*spec) for spec in specs]
+
+    directory = tempfile.mkdtemp(prefix='sensor-feed-bench-')
+    try:
+        if args.sinks:
+            sinks = [create_sink(name, directory, args.mqtt_broker)
+                     for name in args.sinks.split(',')]
+        elif args.use_configured_sinks:
+            sinks = config.sinks()
+        else:
+            sinks = config.sinks(lambda sink_config: sandbox_sink_config(
+                sink_config, directory, args.mqtt_broker
+            ))
+        results = run_feed(sensors, sinks, args.duration / args.speedup,
+                           args.workers, dispatch=args.dispatch,
+                           fanout=args.fanout, queue_size=args.queue_size,
+                           overflow=args.overflow)
+    finally:
+        shutil.rmtree(directory)
+    return format_report(results)
+
+
+def format_report(results):
+    """Format benchmark results as a table."""
+    lines = ['%-16s %10s %12s %9s %9s %6s %8s %8s %8s' % (
+        'sink', 'readings', 'readings/s', 'p50 ms', 'p99 ms', 'cpu %',
+        'rss MB', 'overrun', 'dropped')]
+    for sink_name, result in results.items():
+        lines.append(
+            '%-16s %10d %12.1f %9.2f %9.2f %6.1f %8.1f %8d %8d' % (
+                sink_name, result['readings'], result['rate'],
+                result['p50_ms'], result['p99_ms'], result['cpu_percent'],
+                result['peak_rss_mb'], result['overruns'], result['dropped'],
+            )
+        )
+    return '\n'.join(lines)
+
+
+def add_arguments(parser):
+    """Add the options common to all benchmarks to ``parser``."""
+    parser.add_argument('--duration', default=10, type=float,
+                        help='seconds to run each sink for, default is 10')
+    parser.add_argument('--workers', default=4, type=int,
+                        help='scheduler worker threads, 0 starts a thread per '
+                             'sensor. Default is 4')
+    parser.add_argument('--sinks', default=','.join(SINKS),
+                        help='comma separated sinks to benchmark, from %s and '
+                             'mqtt. Default is all of them except mqtt' %
+                             ', '.join(SINKS))
+    parser.add_argument('--mqtt-broker', default=None,
+                        help='MQTT broker for the mqtt sink')
+    parser.add_argument('--in-process', action='store_true',
+                        help="run every sink in this process rather than a new "
+                             "process each, CPU and RSS then aren't per sink")
+
+
+def get_parser():
+    """Get an ArgumentParser."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sensors', default=10, type=int,
+                        help='number of synthetic sensors, default is 10')
+    parser.add_argument('--period', default=0.1, type=float,
+                        help='seconds between readings of each sensor, '
+                             'default is 0.1')
+    add_arguments(parser)
+    return parser
+
+
+def main(args=None):
+    """Run the benchmarks and print the results."""
+    args = get_parser().parse_args(args)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s: %(message)s')
+    specs = [(sensor.param_name, sensor.period, sensor.dtype)
+             for sensor in synthetic_sensors(args.sensors, args.period)]
+    results = run_sinks(args.sinks.split(','), specs, args.duration,
+                        args.workers, args.mqtt_broker,
+                        isolate=not args.in_process)
+    print(format_report(results))
+
+
+if __name__ == '__main__':
+    main()
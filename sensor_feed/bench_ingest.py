@@ -0,0 +1,121 @@
+"""
+Microbenchmark of draining the ingest queue.
+
+Compares taking samples from a ``queue.Queue`` one at a time (with
+``get_nowait`` and ``task_done``) against draining an ``IngestQueue`` in
+one go, both with the samples already queued and with producer threads
+adding samples while the feed drains. Run with::
+
+    python -m sensor_feed.bench_ingest
+"""
+import argparse
+from queue import Empty, Queue
+from threading import Thread
+import time
+
+from sensor_feed.ingest import IngestQueue
+from sensor_feed.record import Sample
+
+
+def drain_queue(queue, timeout=None):
+    """
+        Take all items from ``queue``.
+
+        An ``IngestQueue`` is drained in one go, other queues are read until
+        an ``Empty`` exception is raised. If ``timeout`` is given we wait up
+        to that many seconds for the first item.
+
+        Returns the list of items.
+    """
+    if isinstance(queue, IngestQueue):
+        return queue.drain(timeout=timeout)
+
+    records = []
+    try:
+        if timeout is not None:
+            item = queue.get(timeout=timeout)
+        else:
+            item = queue.get_nowait()
+        while True:
+            records.append(item)
+            queue.task_done()
+            item = queue.get_nowait()
+    except Empty:
+        pass
+    return records
+
+
+def get_queues():
+    """Get the queues to compare, by name."""
+    return {
+        'Queue, per item': Queue,
+        'IngestQueue.drain': IngestQueue,
+    }
+
+
+def bench_drain(queue_class, samples):
+    """Get the seconds to drain ``samples`` queued samples."""
+    queue = queue_class()
+    for idx in range(samples):
+        queue.put(Sample(0, idx, 1.0))
+    start = time.perf_counter()
+    count = len(drain_queue(queue))
+    elapsed = time.perf_counter() - start
+    assert count == samples
+    return elapsed
+
+
+def bench_dispatch(queue_class, samples, producers):
+    """
+        Get the seconds for ``producers`` threads to put ``samples`` samples
+        between them while the calling thread drains them.
+    """
+    queue = queue_class()
+    per_producer = samples // producers
+
+    def produce(sensor_id):
+        for idx in range(per_producer):
+            queue.put(Sample(sensor_id, idx, 1.0))
+
+    threads = [Thread(target=produce, args=(sensor_id,))
+               for sensor_id in range(producers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    count = 0
+    while count < per_producer * producers:
+        count += len(drain_queue(queue, timeout=1))
+    elapsed = time.perf_counter() - start
+    for thread in threads:
+        thread.join()
+    return elapsed
+
+
+def get_parser():
+    """Get an ArgumentParser."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--samples', default=200000, type=int,
+                        help='number of samples per run, default is 200000')
+    parser.add_argument('--producers', default=4, type=int,
+                        help='number of producer threads, default is 4')
+    parser.add_argument('--repeat', default=5, type=int,
+                        help='runs of each benchmark, the best is reported. '
+                             'Default is 5')
+    return parser
+
+
+def main(args=None):
+    """Run the benchmarks and print the results."""
+    args = get_parser().parse_args(args)
+    print('%-20s %15s %15s' % ('', 'drain/s', 'dispatch/s'))
+    for name, queue_class in get_queues().items():
+        drain = min(bench_drain(queue_class, args.samples)
+                    for _ in range(args.repeat))
+        dispatch = min(bench_dispatch(queue_class, args.samples, args.producers)
+                       for _ in range(args.repeat))
+        print('%-20s %15.0f %15.0f' % (name, args.samples / drain,
+                                       args.samples / dispatch))
+
+
+if __name__ == '__main__':
+    main()
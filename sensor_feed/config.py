@@ -4,6 +4,8 @@ import logging
 
 import yaml
 
+from sensor_feed.aggregate import AggregatingSink
+
 
 LOGGER = logging.getLogger(__name__)
 
@@ -20,13 +22,24 @@ DEFAULTS = {
     ],
 }
 
+#: Sensor attributes that may be set for each sensor in the config, or for
+#: all sensors under ``sensor_defaults``.
+SENSOR_OPTIONS = ('aligned', 'overrun', 'period')
+
+#: Sink attributes that may be set for each sink in the config.
+SINK_OPTIONS = ('params', 'queue_size', 'backpressure')
+
+
 class SensorConfig:
     def __init__(self, fname=None):
         self._raw = dict(DEFAULTS)
         if fname:
-            self._raw = yaml.load(open(fname))
+            with open(fname) as config_file:
+                self._raw = yaml.safe_load(config_file)
 
-    def _objects_from_config(self, objs_config, def_mod):
+    def _objects_from_config(self, objs_config, def_mod, options=(),
+                             defaults=None):
+        defaults = defaults or {}
         objs = []
         for obj_config in objs_config:
             if '.' in obj_config['class']:
@@ -40,6 +53,11 @@ class SensorConfig:
             kwargs = obj_config.get('kwargs', {})
 
             obj = SensorClass(**kwargs)
+            for option in options:
+                value = obj_config.get(option, defaults.get(option))
+                if value is not None:
+                    setattr(obj, option, value)
+
             if hasattr(obj, 'get_sensors'):
                 objs += obj.get_sensors()
             else:
@@ -47,11 +65,78 @@ class SensorConfig:
 
         return objs
 
+    def describe_sensors(self, sensor_period):
+        """
+            Describe the configured sensors without starting them.
+
+            Returns ``(param_name, period, dtype)`` for each sensor, where
+            ``period`` is the period the sensor would be read at by a feed
+            with ``sensor_period``. Sensors that can't be created here (e.g.
+            the hardware libraries aren't installed) are described using
+            their config: the ``param_names`` entry (needed for devices with
+            several parameters) or otherwise the ``param_name`` keyword
+            argument. Raises ValueError if neither is given.
+        """
+        defaults = self._raw.get('sensor_defaults') or {}
+        descriptions = []
+        for sensor_config in self._raw['sensors']:
+            period = sensor_config.get('period', defaults.get('period'))
+            period = period or sensor_period
+            try:
+                sensors = self._objects_from_config([sensor_config],
+                                                    'sensor_feed.sensor',
+                                                    SENSOR_OPTIONS, defaults)
+            except Exception as err:
+                kwargs = sensor_config.get('kwargs', {})
+                param_names = sensor_config.get('param_names')
+                if param_names is None and 'param_name' in kwargs:
+                    param_names = [kwargs['param_name']]
+                if param_names is None:
+                    raise ValueError(
+                        "Unable to create %s (%s), give its param_names in "
+                        "the config to describe it." % (sensor_config['class'],
+                                                        err)
+                    )
+                LOGGER.warning('Unable to create %s (%s), describing from config',
+                               sensor_config['class'], err)
+                descriptions += [(param_name, period, kwargs.get('dtype', float))
+                                 for param_name in param_names]
+                continue
+            for sensor in sensors:
+                period = sensor.period or sensor_period
+                if sensor.min_period is not None:
+                    period = max(period, sensor.min_period)
+                descriptions.append((sensor.param_name, period, sensor.dtype))
+        return descriptions
+
     def sensors(self):
         """Create the sensor objects."""
-        return self._objects_from_config(self._raw['sensors'], 'sensor_feed.sensor')
+        return self._objects_from_config(self._raw['sensors'], 'sensor_feed.sensor',
+                                         SENSOR_OPTIONS,
+                                         self._raw.get('sensor_defaults'))
+
+    def sinks(self, rewrite=None):
+        """
+            Create the sink objects.
 
-    def sinks(self):
-        """Create the sink objects."""
+            A sink with an ``aggregate`` entry is wrapped in an
+            ``AggregatingSink`` using those keyword arguments. Any of
+            ``SINK_OPTIONS`` are then set on the (wrapped) sink. If given,
+            ``rewrite`` is called with each sink's config and returns the
+            config to use instead.
+        """
         LOGGER.critical('Starting sinks...')
-        return self._objects_from_config(self._raw['sinks'], 'sensor_feed.sink')
+        sinks = []
+        for sink_config in self._raw['sinks']:
+            if rewrite is not None:
+                sink_config = rewrite(sink_config)
+            sink, = self._objects_from_config([sink_config], 'sensor_feed.sink')
+            aggregate = sink_config.get('aggregate')
+            if aggregate is not None:
+                sink = AggregatingSink(sink, **aggregate)
+            for option in SINK_OPTIONS:
+                value = sink_config.get(option)
+                if value is not None:
+                    setattr(sink, option, value)
+            sinks.append(sink)
+        return sinks
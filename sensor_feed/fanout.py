@@ -0,0 +1,142 @@
+"""
+Running sinks in parallel.
+
+Each sink is given a ``SinkWorker``: a thread taking batches from a
+bounded queue and passing them to the sink. A slow sink then only holds
+up its own queue, and an exception in one sink is logged and counted
+without affecting the others.
+"""
+from itertools import chain
+import logging
+from queue import Empty, Full, Queue
+from threading import Thread
+import time
+
+from sensor_feed import metrics
+
+
+LOGGER = logging.getLogger(__name__)
+
+#: What to do with a batch for a sink whose queue is full:
+#: ``'block'`` waits for space, ``'drop-oldest'`` discards the oldest
+#: queued batch and ``'drop-newest'`` discards the new batch.
+BACKPRESSURE_POLICIES = ('block', 'drop-oldest', 'drop-newest')
+
+_STOP = object()
+
+
+class SinkWorker:
+    """
+        Passes batches to ``sink`` from a thread of its own.
+
+        Up to ``queue_size`` batches may be waiting, after which new batches
+        are handled according to ``backpressure``. Queued batches are
+        combined so a sink that falls behind catches up in one call.
+
+        ``dropped`` counts the samples discarded and ``errors`` the batches
+        the sink raised an exception for.
+    """
+    def __init__(self, sink, queue_size=100, backpressure='block'):
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError("Unknown backpressure policy: %s" % backpressure)
+        self.sink = sink
+        self.backpressure = backpressure
+        self.dropped = 0
+        self.errors = 0
+        self._queue = Queue(maxsize=queue_size)
+        self._thread = None
+        self._process_time = metrics.histogram(
+            sink.metrics_name + '.process_seconds'
+        )
+        metrics.gauge(sink.metrics_name + '.dropped', lambda: self.dropped)
+        metrics.gauge(sink.metrics_name + '.errors', lambda: self.errors)
+        metrics.gauge(sink.metrics_name + '.queued', self._queue.qsize)
+
+    @property
+    def name(self):
+        return 'sink-%s' % type(self.sink).__name__
+
+    @property
+    def metrics_name(self):
+        """Prefix for the names of the worker's metrics."""
+        return self.sink.metrics_name + '.worker'
+
+    @property
+    def params(self):
+        return getattr(self.sink, 'params', None)
+
+    def subscribes(self, param_name):
+        return self.sink.subscribes(param_name)
+
+    def start(self):
+        """Start the worker thread."""
+        if self._thread is not None:
+            raise RuntimeError("Worker already running.")
+        self._thread = Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Pass on any queued batches and stop the worker thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def process_batch(self, records):
+        """Queue ``records`` for the sink."""
+        if self.backpressure == 'block':
+            self._queue.put(records)
+            return
+
+        while True:
+            try:
+                self._queue.put_nowait(records)
+                return
+            except Full:
+                if self.backpressure == 'drop-newest':
+                    self.dropped += len(records)
+                    return
+            try:
+                oldest = self._queue.get_nowait()
+            except Empty:
+                continue
+            if oldest is _STOP:
+                # never drop the request to stop
+                self._queue.put(oldest)
+                return
+            self.dropped += len(oldest)
+
+    def _run(self):
+        """Pass queued batches to the sink until stopped."""
+        while True:
+            batch = self._queue.get()
+            if batch is _STOP:
+                return
+            # combine anything else waiting, batches may be shared with
+            # other workers so aren't modified
+            batches = [batch]
+            stopping = False
+            try:
+                while True:
+                    batch = self._queue.get_nowait()
+                    if batch is _STOP:
+                        stopping = True
+                        break
+                    batches.append(batch)
+            except Empty:
+                pass
+
+            if len(batches) == 1:
+                records = batches[0]
+            else:
+                records = list(chain.from_iterable(batches))
+            start = time.perf_counter()
+            try:
+                self.sink.process_batch(records)
+                self._process_time.observe(time.perf_counter() - start)
+            except Exception:
+                self.errors += 1
+                LOGGER.exception('Error in %s', self.name)
+            if stopping:
+                return
@@ -1,8 +1,12 @@
 """Main event loop for the sensor feed."""
 import logging
-from queue import Queue, Empty
 import time
 
+from sensor_feed import metrics
+from sensor_feed.fanout import SinkWorker
+from sensor_feed.ingest import IngestQueue
+from sensor_feed.record import get_param_name, register_param
+
 
 LOGGER = logging.getLogger(__name__)
 
@@ -12,25 +16,78 @@ class SensorFeed:
         The main sensor feed controller.
 
         Handles starting, stopping sensors and passing queued data to the sinks.
+
+        All sensors add data to a single ``IngestQueue``. Data is dispatched
+        in one of two modes:
+
+        * ``'event'`` (the default) blocks until a sensor enqueues data
+          and then passes it straight on to the sinks.
+        * ``'poll'`` checks the queue every ``queue_wait_period`` seconds.
+
+        If a ``Scheduler`` is given it is used to run the sensors rather
+        than each sensor starting its own thread.
+
+        The ingest queue holds up to ``queue_size`` samples (unlimited if
+        zero), with ``overflow`` saying what to do when it is full (see
+        ``IngestQueue``).
+
+        Each sink only receives the parameters it subscribes to (see
+        ``Sink.params``), as decided by a ``Router``. With ``fanout``
+        ``'serial'`` (the default) the sinks are called in turn by the
+        feed. With ``'parallel'`` each sink is run by a ``SinkWorker`` with
+        the sink's ``queue_size`` and ``backpressure``, so slow or failing
+        sinks don't hold up the others.
     """
 
-    def __init__(self, sensors, sinks, sensor_period):
+    def __init__(self, sensors, sinks, sensor_period, dispatch='event',
+                 scheduler=None, fanout='serial', queue_size=0,
+                 overflow='block'):
+        if dispatch not in ('event', 'poll'):
+            raise ValueError("Unknown dispatch mode: %s" % dispatch)
+        if fanout not in ('serial', 'parallel'):
+            raise ValueError("Unknown fanout mode: %s" % fanout)
         self.sensors = sensors
         self.sinks = sinks
         self.sensor_period = sensor_period
+        self.dispatch = dispatch
+        self.scheduler = scheduler
         self.queue_wait_period = 5
+        self.ingest = IngestQueue(queue_size, overflow)
+        self.workers = []
+        if fanout == 'parallel':
+            self.workers = [SinkWorker(sink, sink.queue_size, sink.backpressure)
+                            for sink in sinks]
+        self.router = Router(self.workers or sinks)
+        #: Seconds between logging the metrics while running, None for never.
+        self.metrics_period = None
+        self._batch_size = metrics.histogram('feed.batch_size',
+                                             metrics.SIZE_BUCKETS)
+        metrics.gauge('feed.queue_depth', self.ingest.qsize)
+        metrics.gauge('feed.dropped', lambda: sum(self.ingest.dropped.values()))
 
 
     def start_sensors(self):
-        """Start all the sensors."""
-        queues = {}
+        """
+            Start all the sensors.
+
+            Each sensor uses its own ``period`` if set, or the feed's
+            ``sensor_period`` otherwise. The sinks are then initialised
+            with the started sensors.
+        """
         LOGGER.critical('Starting sensors...')
+        if self.scheduler is not None:
+            self.scheduler.start()
         for sensor in self.sensors:
             LOGGER.critical('... %s', sensor.param_name)
-            queue = Queue()
-            sensor.start(queue, self.sensor_period)
-            queues[sensor] = queue
-        self.queues = queues
+            sensor_id = register_param(sensor.param_name)
+            sensor.start(self.ingest.sensor_queue(sensor_id),
+                         sensor.period or self.sensor_period, self.scheduler)
+        self.router.build(sensor.param_name for sensor in self.sensors)
+
+        for sink in self.sinks:
+            sink.initialise(self.sensors)
+        for worker in self.workers:
+            worker.start()
 
 
     def stop_sensors(self):
@@ -48,42 +105,128 @@ class SensorFeed:
             LOGGER.critical('... %s', sensor.param_name)
             # Second pass we actually wait for thread to be joined.
             sensor.stop()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        for param_name, count in self.overruns().items():
+            LOGGER.warning('%s overran its period %d times', param_name, count)
+        for param_name, count in self.dropped().items():
+            LOGGER.warning('%s had %d values dropped', param_name, count)
         LOGGER.critical('... done.')
 
+    def overruns(self):
+        """Get the number of overrunning reads for each sensor that had any."""
+        return {
+            sensor.param_name: sensor.overruns
+            for sensor in self.sensors
+            if getattr(sensor, 'overruns', 0)
+        }
+
+    def dropped(self):
+        """Get the number of samples dropped for each parameter that had any."""
+        return {
+            get_param_name(sensor_id): count
+            for sensor_id, count in self.ingest.dropped.items()
+        }
+
 
     def run(self):
         """
             Run the feed.
 
-            This loops over all the sensors and handles any enqueued data.
-            Each piece of data is then sent to each configured sink.
+            This handles any enqueued data, passing each piece of data to
+            each configured sink.
         """
+        next_metrics = None
+        if self.metrics_period:
+            next_metrics = time.monotonic() + self.metrics_period
         while True:
-            for sensor, queue in self.queues.items():
-                process_queue(sensor.param_name, queue, self.sinks)
-            time.sleep(self.queue_wait_period)
+            if next_metrics is not None and time.monotonic() >= next_metrics:
+                LOGGER.info('Metrics:\n%s', metrics.REGISTRY.format())
+                next_metrics += self.metrics_period
+            if self.dispatch == 'poll':
+                time.sleep(self.queue_wait_period)
+                self.process_pending()
+            else:
+                self.process_pending(timeout=self.queue_wait_period)
+
+    def process_pending(self, timeout=None):
+        """
+            Pass all enqueued data to the sinks.
+
+            If ``timeout`` is given, block for up to that many seconds
+            waiting for data to arrive.
+        """
+        records = self.ingest.drain(timeout=timeout)
+        if records:
+            self._batch_size.observe(len(records))
+            self.router.process_batch(records)
+        return len(records)
 
     def finalise_sinks(self):
         """Tell sinks we're bailing so they can tidy-up."""
         LOGGER.critical('Shutting down sinks...')
+        for worker in self.workers:
+            worker.stop()
+            if worker.dropped or worker.errors:
+                LOGGER.warning('%s dropped %d values and had %d errors',
+                               worker.name, worker.dropped, worker.errors)
         for sink in self.sinks:
             sink.finalise()
+        LOGGER.info('Metrics:\n%s', metrics.REGISTRY.format())
         LOGGER.critical('... done.')
 
 
-def process_queue(sensor_name, queue, sinks):
+class Router:
     """
-        Take all tasks from queue and process them.
+        Passes batches of samples on to the sinks subscribed to them.
 
-        Gets items from ``queue`` until an ``Empty`` exception
-        is raised. For each item we call ``process_value`` on
-        each available sink.
+        Sinks subscribed to all parameters get each batch as it is. For
+        the others a table of the subscribed sinks for each sensor id is
+        built once (by ``build``, or as new ids are seen) so routing each
+        sample is a dict lookup, and sinks are never called with data they
+        don't want.
     """
-    try:
-        while True:
-            timestamp, value = queue.get_nowait()
-            for sink in sinks:
-                sink.process_value(sensor_name, timestamp, value)
-            queue.task_done()
-    except Empty:
-        return
+    def __init__(self, sinks):
+        self.sinks = sinks
+        self.routes = {}
+        self._filtered = [sink for sink in sinks
+                          if getattr(sink, 'params', None) is not None]
+        self._process_times = [
+            metrics.histogram(sink.metrics_name + '.process_seconds')
+            for sink in sinks
+        ]
+
+    def build(self, param_names):
+        """Build the routes for ``param_names``."""
+        for param_name in param_names:
+            self.routes[register_param(param_name)] = tuple(
+                sink for sink in self._filtered if sink.subscribes(param_name)
+            )
+
+    def route(self, sensor_id):
+        """Get the subscribed sinks (other than unfiltered sinks) for ``sensor_id``."""
+        try:
+            return self.routes[sensor_id]
+        except KeyError:
+            self.build([get_param_name(sensor_id)])
+            return self.routes[sensor_id]
+
+    def process_batch(self, records):
+        """Pass ``records`` on to the sinks, in the order they were given."""
+        batches = {}
+        if self._filtered:
+            batches = {sink: [] for sink in self._filtered}
+            route = self.routes.get
+            for sample in records:
+                sinks = route(sample.sensor_id)
+                if sinks is None:
+                    sinks = self.route(sample.sensor_id)
+                for sink in sinks:
+                    batches[sink].append(sample)
+
+        for sink, process_time in zip(self.sinks, self._process_times):
+            batch = batches.get(sink, records)
+            if batch:
+                start = time.perf_counter()
+                sink.process_batch(batch)
+                process_time.observe(time.perf_counter() - start)
@@ -0,0 +1,121 @@
+"""
+A single ingest channel shared by all sensors.
+
+Rather than creating one Queue per sensor, the feed creates one
+``IngestQueue`` and gives each sensor a ``SensorQueue`` handle. Sensors
+continue to ``put((timestamp, value))`` tuples onto their handle, and the
+handle converts each item to a ``Sample`` tagged with the sensor's id
+before adding it to the shared queue. The feed then only has to look at
+one queue, no matter how many sensors are running.
+"""
+from collections import deque
+from datetime import datetime
+from queue import Full
+from threading import Condition, Lock
+
+from sensor_feed.fanout import BACKPRESSURE_POLICIES
+from sensor_feed.record import Sample, to_nanos
+
+
+class IngestQueue:
+    """
+        A queue of ``Sample`` records.
+
+        Sensors ``put`` samples one at a time, the feed takes everything
+        waiting with ``drain``. Draining swaps the pending samples for an
+        empty deque so it only takes the lock once however many samples
+        are waiting, and there is no ``task_done`` bookkeeping.
+
+        If ``maxsize`` is greater than zero at most that many samples are
+        queued. Further samples are handled according to ``overflow``, one
+        of ``BACKPRESSURE_POLICIES``: ``'block'`` makes the sensor wait for
+        space, ``'drop-oldest'`` discards the oldest queued sample and
+        ``'drop-newest'`` the new sample. ``dropped`` counts the discarded
+        samples for each sensor id.
+    """
+    def __init__(self, maxsize=0, overflow='block'):
+        if overflow not in BACKPRESSURE_POLICIES:
+            raise ValueError("Unknown overflow policy: %s" % overflow)
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.dropped = {}
+        self._items = deque()
+        self._lock = Lock()
+        self._not_empty = Condition(self._lock)
+        self._not_full = Condition(self._lock)
+
+    def qsize(self):
+        """Get the number of waiting samples."""
+        return len(self._items)
+
+    def empty(self):
+        return not self._items
+
+    def put(self, item, block=True, timeout=None):
+        """
+            Add ``item`` to the queue, dropping a sample or waiting for
+            space if full.
+
+            As for ``Queue.put``, ``Full`` is raised if ``overflow`` is
+            ``'block'`` and there's no space within ``timeout`` seconds, or
+            straight away if ``block`` is False.
+        """
+        with self._lock:
+            if 0 < self.maxsize <= len(self._items):
+                if self.overflow == 'drop-newest':
+                    self._count_drop(item)
+                    return
+                elif self.overflow == 'drop-oldest':
+                    self._count_drop(self._items.popleft())
+                elif not block or not self._not_full.wait_for(
+                        lambda: len(self._items) < self.maxsize, timeout):
+                    raise Full
+            self._items.append(item)
+            self._not_empty.notify()
+
+    def _count_drop(self, sample):
+        """Count ``sample`` as dropped, must hold the lock."""
+        self.dropped[sample.sensor_id] = self.dropped.get(sample.sensor_id, 0) + 1
+
+    def drain(self, timeout=None):
+        """
+            Take all the waiting samples.
+
+            If ``timeout`` is given, wait up to that many seconds for a
+            sample to arrive. Returns a (possibly empty) list.
+        """
+        with self._lock:
+            if timeout is not None and not self._items:
+                self._not_empty.wait_for(lambda: self._items, timeout)
+            items = self._items
+            if not items:
+                return []
+            self._items = deque()
+            if self.maxsize > 0:
+                self._not_full.notify_all()
+        return list(items)
+
+    def sensor_queue(self, sensor_id):
+        """Get a queue-like handle for the sensor with id ``sensor_id``."""
+        return SensorQueue(self, sensor_id)
+
+
+class SensorQueue:
+    """
+        The queue-like handle given to a single sensor.
+
+        Only ``put`` is supported, the feed reads from the underlying
+        ``IngestQueue``.
+    """
+    __slots__ = ('ingest', 'sensor_id')
+
+    def __init__(self, ingest, sensor_id):
+        self.ingest = ingest
+        self.sensor_id = sensor_id
+
+    def put(self, item, block=True, timeout=None):
+        """Add a ``(timestamp, value)`` item to the ingest queue."""
+        timestamp, value = item
+        if isinstance(timestamp, datetime):
+            timestamp = to_nanos(timestamp)
+        self.ingest.put(Sample(self.sensor_id, timestamp, value), block, timeout)
@@ -0,0 +1,187 @@
+"""
+Metrics for looking inside the feed.
+
+Metrics are kept in a ``Registry``, by default the module level
+``REGISTRY``, and are got by name much like loggers::
+
+    samples = metrics.counter('sensor.temp.samples')
+    samples.inc()
+
+There are three kinds of metric:
+
+* a ``Counter`` counts events,
+* a ``Histogram`` counts observed values in fixed buckets, e.g. the time
+  taken by each call to a sink,
+* a ``Gauge`` calls a function to get its value when read, so costs
+  nothing until the metrics are reported.
+
+Creating a metric takes a lock, updating one doesn't. Each metric is
+expected to be updated by one thread at a time (e.g. a sensor's read job
+or the feed), which holds for all the metrics the feed uses.
+"""
+from bisect import bisect_left
+import logging
+from threading import Lock
+
+
+LOGGER = logging.getLogger(__name__)
+
+#: Default histogram bucket upper bounds for durations in seconds.
+SECONDS_BUCKETS = tuple(
+    mantissa * 10.0 ** exponent
+    for exponent in range(-6, 2) for mantissa in (1, 2.5, 5)
+)
+
+#: Default histogram bucket upper bounds for sizes, e.g. batch sizes.
+SIZE_BUCKETS = tuple(2 ** power for power in range(17))
+
+
+class Counter:
+    """A count of events."""
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, count=1):
+        self.value += count
+
+    def read(self):
+        return self.value
+
+
+class Gauge:
+    """A value read from ``func`` when needed."""
+    __slots__ = ('func',)
+
+    def __init__(self, func):
+        self.func = func
+
+    def read(self):
+        return self.func()
+
+
+class Histogram:
+    """
+        Counts of values falling in buckets with upper bounds ``bounds``.
+
+        Values above the last bound are counted in an overflow bucket.
+    """
+    __slots__ = ('bounds', 'counts', 'count', 'total')
+
+    def __init__(self, bounds=SECONDS_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0
+
+    def observe(self, value):
+        """Count ``value``."""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, percent):
+        """
+            Get an upper bound for the ``percent`` percentile, None if
+            there are no values. Infinity is returned if the percentile is
+            above the largest bound.
+        """
+        if not self.count:
+            return None
+        target = self.count * percent / 100
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def read(self):
+        """Get a summary of the observed values."""
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+        }
+
+
+class Registry:
+    """A collection of named metrics."""
+    def __init__(self):
+        self._metrics = {}
+        self._lock = Lock()
+
+    def _get(self, name, kind, *args):
+        """Get the metric called ``name``, creating a ``kind`` if needed."""
+        try:
+            metric = self._metrics[name]
+        except KeyError:
+            with self._lock:
+                metric = self._metrics.setdefault(name, kind(*args))
+        if not isinstance(metric, kind):
+            raise TypeError("Metric %s is a %s" % (name, type(metric).__name__))
+        return metric
+
+    def counter(self, name):
+        """Get the ``Counter`` called ``name``."""
+        return self._get(name, Counter)
+
+    def histogram(self, name, bounds=SECONDS_BUCKETS):
+        """Get the ``Histogram`` called ``name``."""
+        return self._get(name, Histogram, bounds)
+
+    def gauge(self, name, func):
+        """Set the ``Gauge`` called ``name`` to read ``func``."""
+        with self._lock:
+            metric = self._metrics[name] = Gauge(func)
+        return metric
+
+    def snapshot(self):
+        """Get the current value of each metric, by name."""
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        return {name: metric.read() for name, metric in metrics}
+
+    def format(self):
+        """Format the current metrics, one per line."""
+        lines = []
+        for name, value in self.snapshot().items():
+            if isinstance(value, dict):
+                value = ' '.join('%s=%s' % (key, _format_value(val))
+                                 for key, val in value.items())
+            else:
+                value = _format_value(value)
+            lines.append('%s %s' % (name, value))
+        return '\n'.join(lines)
+
+    def clear(self):
+        """Remove all metrics."""
+        with self._lock:
+            self._metrics.clear()
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return '%.6g' % value
+    return str(value)
+
+
+#: The default registry.
+REGISTRY = Registry()
+
+
+def counter(name):
+    """Get the ``Counter`` called ``name`` from the default registry."""
+    return REGISTRY.counter(name)
+
+
+def histogram(name, bounds=SECONDS_BUCKETS):
+    """Get the ``Histogram`` called ``name`` from the default registry."""
+    return REGISTRY.histogram(name, bounds)
+
+
+def gauge(name, func):
+    """Set the ``Gauge`` called ``name`` in the default registry."""
+    return REGISTRY.gauge(name, func)
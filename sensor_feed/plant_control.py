@@ -30,6 +30,8 @@ class PlantControl(SleepingSensor, Sink):
         self.threshold = 1300
         self.water_period = 20
         self.min_period = self.water_period + 2
+        self.period = self.min_period
+        self.params = (self.trigger_param,)
         self._watering = Lock()
         self.gpio_pin = 17
 
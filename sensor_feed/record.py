@@ -0,0 +1,91 @@
+"""
+Compact records for sensor readings.
+
+Each reading passed through the feed is a ``Sample`` holding a small
+integer id for the parameter, the timestamp as int nanoseconds since the
+epoch and the value. Parameter names are registered once with
+``register_param`` and looked up by id when needed, and the timestamp is
+only converted to a ``datetime`` for sinks that ask for one.
+"""
+from collections import namedtuple
+from datetime import datetime
+from threading import Lock
+
+
+NANOS = 10 ** 9
+
+_PARAM_IDS = {}
+_PARAM_NAMES = []
+_REGISTER_LOCK = Lock()
+
+
+def register_param(param_name):
+    """
+        Get the id for ``param_name``, registering it if needed.
+
+        Ids are small ints, allocated in order from 0.
+    """
+    try:
+        return _PARAM_IDS[param_name]
+    except KeyError:
+        pass
+    with _REGISTER_LOCK:
+        if param_name not in _PARAM_IDS:
+            _PARAM_IDS[param_name] = len(_PARAM_NAMES)
+            _PARAM_NAMES.append(param_name)
+        return _PARAM_IDS[param_name]
+
+
+def get_param_name(sensor_id):
+    """Get the parameter name registered for ``sensor_id``."""
+    return _PARAM_NAMES[sensor_id]
+
+
+def to_nanos(timestamp):
+    """
+        Convert a timestamp to int nanoseconds since the epoch.
+
+        ``timestamp`` may already be in nanoseconds, a ``datetime`` (naive
+        datetimes are taken to be local time), a ``np.datetime64`` or a
+        float number of seconds as returned by ``time.time``.
+    """
+    if isinstance(timestamp, int):
+        return timestamp
+    if isinstance(timestamp, datetime):
+        seconds = int(timestamp.replace(microsecond=0).timestamp())
+        return seconds * NANOS + timestamp.microsecond * 1000
+    if hasattr(timestamp, 'astype'):
+        # np.datetime64
+        return int(timestamp.astype('datetime64[ns]').astype('i8'))
+    return int(round(timestamp * NANOS))
+
+
+def to_datetime(nanos):
+    """Convert int nanoseconds since the epoch to a local ``datetime``."""
+    seconds, nanos = divmod(nanos, NANOS)
+    return datetime.fromtimestamp(seconds).replace(microsecond=nanos // 1000)
+
+
+class Sample(namedtuple('Sample', ['sensor_id', 'ts', 'value'])):
+    """
+        A single sensor reading.
+
+        ``sensor_id`` is the id registered for the parameter, ``ts`` the
+        time of the reading in int nanoseconds since the epoch.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_value(cls, param_name, timestamp, value):
+        """Create a Sample from a parameter name and any timestamp."""
+        return cls(register_param(param_name), to_nanos(timestamp), value)
+
+    @property
+    def param_name(self):
+        """The name of the sampled parameter."""
+        return _PARAM_NAMES[self.sensor_id]
+
+    @property
+    def timestamp(self):
+        """The time of the reading as a local ``datetime``."""
+        return to_datetime(self.ts)
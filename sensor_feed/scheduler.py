@@ -0,0 +1,330 @@
+"""
+Scheduling of periodic sensor reads.
+
+A ``Ticker`` works out when each sample of a periodic read is due. It is
+used both by the per-sensor threads and by the central ``Scheduler``.
+
+Rather than each sensor running its own thread with its own sleep loop,
+a single ``Scheduler`` thread keeps a priority queue of the next time each
+job is due. Due jobs are handed to a small, bounded pool of worker threads
+to do the actual (possibly slow) reads.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import itertools
+import logging
+import math
+from threading import Condition, Event, Thread
+import time
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+#: Ways a Ticker can handle a read that takes longer than its period.
+OVERRUN_POLICIES = ('skip', 'immediate', 'stretch', 'raise')
+
+#: Seconds the wall clock may move relative to monotonic time before an
+#: aligned Ticker resynchronises to it, e.g. when NTP steps the clock.
+CLOCK_JUMP = 1.0
+
+
+class Ticker:
+    """
+        Deadlines for a read every ``period`` seconds.
+
+        Deadlines are ``time.monotonic`` values so are unaffected by
+        changes to the wall clock.
+
+        By default the next deadline is ``period`` seconds after the
+        current read started, so any delay accumulates. If ``aligned`` is
+        True deadlines are instead fixed to a grid of multiples of
+        ``period`` since the epoch (t0 + k * period). Samples don't drift
+        and the samples of sensors with the same period line up. The
+        timestamp reported for each sample is then the grid time. If the
+        wall clock is stepped (e.g. by NTP on a board without a real time
+        clock) the grid is moved to match once the current read finishes.
+
+        Timestamps are int nanoseconds since the epoch.
+
+        If a read finishes after the next deadline it is counted in
+        ``overruns`` and handled according to ``overrun``:
+
+        * ``'skip'`` skips any missed deadlines.
+        * ``'immediate'`` starts the next read straight away.
+        * ``'stretch'`` lengthens the period to a multiple of the
+          configured period that fits the read, shortening it again as
+          reads get faster.
+        * ``'raise'`` raises a RuntimeError.
+    """
+    def __init__(self, period, aligned=False, overrun='skip', name=''):
+        if overrun not in OVERRUN_POLICIES:
+            raise ValueError("Unknown overrun policy: %s" % overrun)
+        self.base_period = period
+        self._base_nanos = round(period * 1e9)
+        # spacing of the aligned grid, exactly the nanoseconds between
+        # timestamps so deadlines don't drift from them
+        self._grid_period = self._base_nanos / 1e9
+        self.aligned = aligned
+        self.overrun = overrun
+        self.name = name
+        #: Number of reads that took longer than the period.
+        self.overruns = 0
+        #: Number of reads that raised an exception.
+        self.errors = 0
+        self._multiple = 1
+
+        now = time.monotonic()
+        # Offset from monotonic to wall clock time, see _check_clock
+        self._wall_offset = time.time() - now
+        self._started = now
+        if aligned:
+            self._step = math.ceil((now + self._wall_offset) / self._grid_period)
+            self.deadline = self._grid_deadline()
+        else:
+            self.deadline = now
+
+    @property
+    def period(self):
+        """The current period, allowing for any stretching."""
+        return self.base_period * self._multiple
+
+    def _grid_deadline(self):
+        return self._step * self._grid_period - self._wall_offset
+
+    def _next_deadline(self):
+        """The deadline after the current read at the current period."""
+        if self.aligned:
+            return ((self._step + self._multiple) * self._grid_period -
+                    self._wall_offset)
+        return self._started + self.period
+
+    def delay(self):
+        """Seconds until the next deadline, negative if overdue."""
+        return self.deadline - time.monotonic()
+
+    def tick(self):
+        """
+            Mark the start of a read.
+
+            Returns the sample timestamp in nanoseconds since the epoch.
+        """
+        self._started = time.monotonic()
+        if self.aligned:
+            return self._step * self._base_nanos
+        return time.time_ns()
+
+    def advance(self):
+        """
+            Move to the next deadline once a read has finished.
+
+            Applies the overrun policy if the read took longer than
+            ``period``.
+        """
+        now = time.monotonic()
+        if self.aligned:
+            self._check_clock(now)
+        # compare with the period the read was started under, before any
+        # stretching, so every overrun is counted
+        if self._next_deadline() < now:
+            self.overruns += 1
+            LOGGER.warning('Read for %s overran its %f second period '
+                           '(%d overruns).', self.name, self.period,
+                           self.overruns)
+            if self.overrun == 'raise':
+                raise RuntimeError("Sensor too slow. Unable to get " +
+                                   "reading in configured period of "
+                                   "%f seconds." % self.period)
+        if self.overrun == 'stretch':
+            self._stretch(now - self._started)
+        self.deadline = self._next_deadline()
+        if self.aligned:
+            self._step += self._multiple
+        if self.deadline >= now:
+            return
+
+        if self.overrun == 'immediate':
+            if self.aligned:
+                # the most recent grid time so the timestamp is still aligned
+                self._step = math.floor((now + self._wall_offset) /
+                                        self._grid_period)
+            self.deadline = now
+        else:
+            missed = math.ceil((now - self.deadline) / self.period)
+            if self.aligned:
+                self._step += missed * self._multiple
+                self.deadline = self._grid_deadline()
+            else:
+                self.deadline += missed * self.period
+
+    def _check_clock(self, now):
+        """Resynchronise to the wall clock if it has been changed."""
+        jump = time.time() - (now + self._wall_offset)
+        if abs(jump) <= CLOCK_JUMP:
+            return
+        LOGGER.warning('Wall clock changed by %f seconds, realigning %s.',
+                       jump, self.name)
+        self._wall_offset += jump
+        # the latest grid time, advance moves on to the next one
+        self._step = math.floor((now + self._wall_offset) / self._grid_period)
+
+    def _stretch(self, elapsed):
+        """Adapt the period to a read that took ``elapsed`` seconds."""
+        wanted = max(1, math.ceil(elapsed / self.base_period))
+        if wanted > self._multiple:
+            self._multiple = wanted
+        elif wanted < self._multiple:
+            self._multiple -= 1
+        else:
+            return
+        LOGGER.info('Period for %s is now %f seconds.', self.name, self.period)
+
+
+def run_once(job, ticker):
+    """
+        Call ``job(timestamp)`` for ``ticker``'s current deadline and move
+        on to the next.
+
+        An exception from ``job`` is logged and counted in
+        ``ticker.errors``, and the job is run again at the next deadline,
+        unless the ticker's overrun policy is ``'raise'`` in which case it
+        is raised.
+    """
+    try:
+        job(ticker.tick())
+    except Exception:
+        ticker.errors += 1
+        if ticker.overrun == 'raise':
+            raise
+        LOGGER.exception('Read for %s failed (%d errors).', ticker.name,
+                         ticker.errors)
+    ticker.advance()
+
+
+def run_periodic(job, ticker, shutdown_event, name=''):
+    """
+        Call ``job(timestamp)`` at each of ``ticker``'s deadlines until
+        ``shutdown_event`` is set, or the job fails under the ``'raise'``
+        overrun policy (see ``run_once``).
+    """
+    while not shutdown_event.is_set():
+        delay = ticker.delay()
+        LOGGER.debug('Periodic read for %s: sleep=%f', name, delay)
+        if delay > 0 and shutdown_event.wait(delay):
+            break
+        try:
+            run_once(job, ticker)
+        except Exception:
+            LOGGER.exception('Periodic read for %s failed, stopping.', name)
+            return
+
+
+class Job:
+    """A periodic job managed by a ``Scheduler``."""
+    def __init__(self, func, ticker, name=''):
+        self.func = func
+        self.ticker = ticker
+        self.name = name
+        self.cancelled = False
+        #: Set whenever the job is not running on a worker.
+        self.idle = Event()
+        self.idle.set()
+
+
+class Scheduler:
+    """
+        Runs periodic jobs using one scheduling thread and a pool of
+        ``max_workers`` worker threads.
+
+        Each job is called with its sample timestamp in nanoseconds since
+        the epoch. A job is never run concurrently with itself, its
+        next run is only scheduled once the current one has finished.
+    """
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = Condition()
+        self._shutdown = False
+        self._thread = None
+        self._executor = None
+
+    def start(self):
+        """Start the scheduling thread and worker pool."""
+        if self._thread is not None:
+            raise RuntimeError("Scheduler already running.")
+        self._shutdown = False
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._thread = Thread(target=self._run, name='scheduler')
+        self._thread.start()
+
+    def stop(self):
+        """Stop scheduling and wait for running jobs to finish."""
+        if self._thread is None:
+            return
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+        self._thread = None
+        self._executor = None
+
+    def add(self, func, ticker, name=''):
+        """
+            Call ``func(timestamp)`` at each of ``ticker``'s deadlines.
+
+            Returns the ``Job`` which can be passed to ``remove``.
+        """
+        job = Job(func, ticker, name)
+        self._push(job)
+        return job
+
+    def remove(self, job, join=True):
+        """
+            Stop running ``job``.
+
+            If ``join`` is True, wait for any current run of the job to
+            finish.
+        """
+        job.cancelled = True
+        if join:
+            job.idle.wait()
+
+    def _push(self, job):
+        with self._condition:
+            heapq.heappush(self._heap,
+                           (job.ticker.deadline, next(self._counter), job))
+            self._condition.notify()
+
+    def _run(self):
+        """Scheduling loop, hands due jobs to the worker pool."""
+        with self._condition:
+            while not self._shutdown:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+
+                deadline, _, job = self._heap[0]
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+
+                heapq.heappop(self._heap)
+                if job.cancelled:
+                    continue
+                job.idle.clear()
+                self._executor.submit(self._execute, job)
+
+    def _execute(self, job):
+        """Run a job on a worker thread then schedule its next run."""
+        try:
+            run_once(job.func, job.ticker)
+        except Exception:
+            LOGGER.exception('Job %s failed, no longer scheduled.', job.name)
+            job.cancelled = True
+        finally:
+            if not job.cancelled:
+                self._push(job)
+            job.idle.set()
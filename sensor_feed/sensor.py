@@ -1,9 +1,11 @@
 """Sensor definitions."""
-from datetime import datetime
 import logging
 from threading import Event, Thread
 import time
 
+from sensor_feed import metrics
+from sensor_feed.scheduler import Ticker, run_periodic
+
 
 LOGGER = logging.getLogger(__name__)
 
@@ -15,7 +17,8 @@ class Sensor:
         Each sensor is started in its own thread and is free
         to what ever it needs to return data at the frequency
         requested. It returns data by adding (timestamp, value)
-        tuples to the provided Queue object.
+        tuples to the provided Queue object. Timestamps should be int
+        nanoseconds since the epoch (datetimes are also accepted).
     """
     #: Name of the sensed parameter
     param_name = ''
@@ -27,20 +30,39 @@ class Sensor:
     min_period = None
     #: Longest possible period between readings (in seconds)
     max_period = None
+    #: Period between readings (in seconds), None to use the feed's period.
+    #: Set to the actual period once started.
+    period = None
     #: Data type of parameter data.
     dtype = float
+    #: Whether readings are aligned to multiples of the period (see Ticker).
+    aligned = False
+    #: How to handle reads slower than the period (see Ticker).
+    overrun = 'skip'
 
 
     def __init__(self):
         self.current_thread = None
+        self.current_job = None
         self.shutdown_event = None
+        self.scheduler = None
+        self.ticker = None
+
+    @property
+    def overruns(self):
+        """Number of reads that have taken longer than the period."""
+        if self.ticker is None:
+            return 0
+        return self.ticker.overruns
 
-    def start(self, queue, period):
+    def start(self, queue, period, scheduler=None):
         """
             Start collecting data.
 
             Should set self up to add data to ``queue`` every ``period``
-            seconds.
+            seconds. If a ``Scheduler`` is given and the sensor provides a
+            job (see ``get_job``) the scheduler is used, otherwise a thread
+            is started for this sensor.
         """
         if self.min_period is not None and period < self.min_period:
             raise ValueError("Requested period is too short " +
@@ -54,9 +76,24 @@ class Sensor:
                                  self.max_period
                              ))
 
-        if self.current_thread is not None:
+        if self.current_thread is not None or self.current_job is not None:
             raise RuntimeError("Sensor already running.")
 
+        self.period = period
+        self.ticker = Ticker(period, self.aligned, self.overrun,
+                             self.param_name)
+        metrics.gauge('sensor.%s.overruns' % self.param_name,
+                      lambda: self.overruns)
+        metrics.gauge('sensor.%s.errors' % self.param_name,
+                      lambda: self.ticker.errors)
+        if scheduler is not None:
+            job = self.get_job(queue, period)
+            if job is not None:
+                self.scheduler = scheduler
+                self.current_job = scheduler.add(job, self.ticker,
+                                                 self.param_name)
+                return
+
         self.shutdown_event = Event()
         self.current_thread = self.get_thread(queue, period, self.shutdown_event)
         self.current_thread.start()
@@ -64,6 +101,12 @@ class Sensor:
 
     def stop(self, join=True):
         """Stop collecting data."""
+        if self.current_job is not None:
+            self.scheduler.remove(self.current_job, join)
+            if join:
+                self.current_job = None
+                self.scheduler = None
+            return
         if self.current_thread is None:
             return
         self.shutdown_event.set()
@@ -77,6 +120,17 @@ class Sensor:
         """Create a Thread object that will do the work."""
         raise NotImplementedError("Subclasses must implement.")
 
+    def get_job(self, queue, period):
+        """
+            Get a function to be run by a ``Scheduler`` every ``period``
+            seconds.
+
+            The function is called with the trigger time and should add
+            data to ``queue``. Returns None if this sensor can't be run by a
+            scheduler.
+        """
+        return None
+
 
 class SleepingSensor(Sensor):
     """A simple dummy sensor for testing."""
@@ -85,33 +139,22 @@ class SleepingSensor(Sensor):
         raise NotImplementedError("Subclasses must implement.")
 
 
+    def get_job(self, queue, period):
+        samples = metrics.counter('sensor.%s.samples' % self.param_name)
+        read_time = metrics.histogram('sensor.%s.read_seconds' % self.param_name)
+
+        def job(trigger_time):
+            start = time.perf_counter()
+            value = self.get_value()
+            read_time.observe(time.perf_counter() - start)
+            queue.put((trigger_time, value))
+            samples.inc()
+        return job
+
     def get_thread(self, queue, period, shutdown_event):
-        def run():
-            keep_going = True
-            while keep_going:
-                trigger_time = time.time()
-                next_trigger = trigger_time + period
-
-                if shutdown_event.is_set():
-                    keep_going = False
-                    continue
-
-                # We allow for get_value taking some time to get
-                # the value.
-                # This is done by only sleeping by period - get_value time.
-                queue.put((datetime.fromtimestamp(trigger_time),
-                           self.get_value()))
-
-                finished_time = time.time()
-                sleep_time = next_trigger - finished_time
-                LOGGER.debug('Sensor thread for %s: sleep=%f', self.param_name, sleep_time)
-                if sleep_time < 0:
-                    raise RuntimeError("Sensor too slow. Unable to get " +
-                                       "reading in configured period of "
-                                       "%f seconds." % period)
-                time.sleep(sleep_time)
-        thread = Thread(target=run)
-        return thread
+        job = self.get_job(queue, period)
+        return Thread(target=run_periodic,
+                      args=(job, self.ticker, shutdown_event, self.param_name))
 
 
 class ConstantSensor(SleepingSensor):
@@ -130,27 +173,71 @@ class ConstantSensor(SleepingSensor):
         return self.value
 
 
-def load_average():
-    with open("/proc/stat") as stat:
-        a = [float(val) for val in stat.readline().split()[1:5]]
-    time.sleep(1)
+def read_cpu_times(fname='/proc/stat'):
+    """
+        Read the cumulative CPU times from ``fname``.
+
+        Returns a dict mapping each ``cpu`` line's name (``'cpu'`` for the
+        total, ``'cpu0'``, ``'cpu1'``, ... for each core) to a tuple of
+        (busy, total) times.
+    """
+    times = {}
+    with open(fname) as stat:
+        for line in stat:
+            if not line.startswith('cpu'):
+                break
+            fields = line.split()
+            user, nice, system, idle = [float(val) for val in fields[1:5]]
+            busy = user + nice + system
+            times[fields[0]] = (busy, busy + idle)
+    return times
+
+
+class CpuLoadTracker:
+    """
+        Tracks CPU load between successive reads of ``/proc/stat``.
+
+        Each call to ``update`` returns the fraction of time each CPU was
+        busy since the previous call (or since boot for the first call), so
+        no sleeping is needed between reads.
+    """
+    def __init__(self, fname='/proc/stat'):
+        self.fname = fname
+        self._last = {}
+        self._loads = {}
+
+    def update(self):
+        """Get a dict of the load of each CPU since the last update."""
+        current = read_cpu_times(self.fname)
+        for name, (busy, total) in current.items():
+            last_busy, last_total = self._last.get(name, (0.0, 0.0))
+            # If no time has passed for this CPU keep the previous value.
+            if total > last_total:
+                self._loads[name] = (busy - last_busy) / (total - last_total)
+        self._last = current
+        return dict(self._loads)
 
-    with open("/proc/stat") as stat:
-        b = [float(val) for val in stat.readline().split()[1:5]]
 
-    loadavg = (((b[0] + b[1] + b[2]) - (a[0] + a[1] + a[2])) /
-               ((b[0] + b[1] + b[2] + b[3]) - (a[0] + a[1] + a[2] + a[3])))
-    return loadavg
+def load_average():
+    """Get the CPU load over the next second."""
+    tracker = CpuLoadTracker()
+    tracker.update()
+    time.sleep(1)
+    return tracker.update()['cpu']
 
 
 class CpuLoadAverage(SleepingSensor):
     param_name = 'cpu'
     param_id = 'cpu'
     param_unit = '%'
-    min_period = 1.1
+    min_period = 0.1
+
+    def __init__(self, *args, **kwargs):
+        super(CpuLoadAverage, self).__init__(*args, **kwargs)
+        self._tracker = CpuLoadTracker()
 
     def get_value(self):
-        return load_average()
+        return self._tracker.update()['cpu']
 
 
 class RiseAndFallSensor(SleepingSensor):
@@ -0,0 +1,35 @@
+"""
+CPU load for the whole machine and for each core.
+"""
+import logging
+
+from sensor_feed.sensor import CpuLoadTracker, read_cpu_times
+from sensor_feed.sensor_multi import MultiSensorDevice, ChildSensor
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CpuCoreLoad(MultiSensorDevice):
+    """Load of the CPU as a whole and of each core from /proc/stat."""
+    device_name = 'cpu'
+    min_period = 0.1
+
+    def __init__(self, *args, fname='/proc/stat', **kwargs):
+        super(CpuCoreLoad, self).__init__(*args, **kwargs)
+        self._tracker = CpuLoadTracker(fname)
+        self._children = [
+            ChildSensor(self, name, name, '%')
+            for name in read_cpu_times(fname)
+        ]
+
+    def enqueue_values(self, timestamp):
+        """Put the load of each CPU on its child sensor's queue."""
+        loads = self._tracker.update()
+        for sensor in self._children:
+            try:
+                queue = self.queues[sensor]
+            except KeyError:
+                # not running, skip.
+                continue
+            queue.put((timestamp, loads[sensor.param_id]))
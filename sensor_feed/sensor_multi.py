@@ -9,16 +9,22 @@ of ChildSensors, starting any of those sensors just passes
 the command onto the parent device, the parent device then
 passes data back to the feed via a collection of queues.
 """
-from datetime import datetime
+from collections import defaultdict
+import itertools
 import logging
 from threading import Event, Thread
 import time
 
+from sensor_feed import metrics
+from sensor_feed.scheduler import Ticker, run_periodic
 from sensor_feed.sensor import Sensor
 
 
 LOGGER = logging.getLogger(__name__)
 
+# Number of devices of each name named so far, for unique metric names.
+_DEVICE_COUNTS = defaultdict(itertools.count)
+
 
 class ChildSensor(Sensor):
     """
@@ -34,14 +40,34 @@ class ChildSensor(Sensor):
         self.param_unit = param_id
         self.dtype = dtype
 
-    def start(self, queue, period):
+    def start(self, queue, period, scheduler=None):
         """Start this sensor. Delegates to parent."""
-        self.parent.start(self, queue, period)
+        self.parent.start(self, queue, period, scheduler)
 
     def stop(self, join=True):
         """Stop this sensor. Delegates to parent."""
         self.parent.stop(self, join)
 
+    @property
+    def overruns(self):
+        """Number of reads by the parent longer than the period."""
+        return self.parent.overruns
+
+    @property
+    def period(self):
+        """Period between readings, as for the parent."""
+        return self.parent.period
+
+    @property
+    def aligned(self):
+        """Whether readings are aligned, as for the parent."""
+        return self.parent.aligned
+
+    @property
+    def min_period(self):
+        """Shortest possible period between readings, as for the parent."""
+        return self.parent.min_period
+
 
 class MultiSensorDevice:
     """
@@ -70,10 +96,20 @@ class MultiSensorDevice:
     min_period = None
     #: Longest possible period between readings (in seconds)
     max_period = None
+    #: Period between readings (in seconds), None to use the feed's period.
+    #: Set to the actual period once started.
+    period = None
+    #: Whether readings are aligned to multiples of the period (see Ticker).
+    aligned = False
+    #: How to handle reads slower than the period (see Ticker).
+    overrun = 'skip'
 
     def __init__(self):
         self.current_thread = None
+        self.current_job = None
         self.shutdown_event = None
+        self.scheduler = None
+        self.ticker = None
         self.queues = dict()
 
         # implementing classes will need to make this actually
@@ -85,6 +121,8 @@ class MultiSensorDevice:
             Actually get the data from the hardware and add it to the
             data feed queues.
 
+            ``timestamp`` is in int nanoseconds since the epoch.
+
             This class needs to be implemented by any subclass.
 
             It may, for example, use I2C to get data from two or more
@@ -93,16 +131,42 @@ class MultiSensorDevice:
         """
         raise NotImplementedError("subclass to implement")
 
+    @property
+    def overruns(self):
+        """Number of reads that have taken longer than the period."""
+        if self.ticker is None:
+            return 0
+        return self.ticker.overruns
+
+    @property
+    def metrics_name(self):
+        """
+            Prefix for the names of the device's metrics, unique to the device.
+
+            The first device with a ``device_name`` is named after it, later
+            ones have a number added, e.g. ``device.dummy_1``.
+        """
+        try:
+            return self._metrics_name
+        except AttributeError:
+            pass
+        name = self.device_name
+        index = next(_DEVICE_COUNTS[name])
+        if index:
+            name = '%s_%d' % (name, index)
+        self._metrics_name = 'device.' + name
+        return self._metrics_name
+
     def get_sensors(self):
         """Get a list of Sensor-like objects."""
         return self._children
 
-    def start(self, child, queue, period):
+    def start(self, child, queue, period, scheduler=None):
         """
             Start collecting data for child.
 
-            If this is the first call then a new data collection thread
-            is started.
+            If this is the first call then data collection is started,
+            using ``scheduler`` if given or a new thread otherwise.
         """
         if self.min_period is not None and period < self.min_period:
             raise ValueError("Requested period is too short " +
@@ -120,9 +184,24 @@ class MultiSensorDevice:
             raise RuntimeError("Child sensor already running.")
 
         self.queues[child] = queue
+        # each read of the device produces a sample for each running child
+        reads = metrics.counter(self.metrics_name + '.reads')
+        metrics.gauge('sensor.%s.samples' % child.param_name, reads.read)
+
+        if self.current_job is not None or self.current_thread is not None:
+            return
 
-        if self.current_thread is None:
-            # first sensor to configure, start collector thread
+        # first sensor to configure, start data collection
+        self.period = period
+        self.ticker = Ticker(period, self.aligned, self.overrun,
+                             self.device_name)
+        metrics.gauge(self.metrics_name + '.overruns', lambda: self.overruns)
+        metrics.gauge(self.metrics_name + '.errors', lambda: self.ticker.errors)
+        if scheduler is not None:
+            self.scheduler = scheduler
+            self.current_job = scheduler.add(self.get_job(period), self.ticker,
+                                             self.device_name)
+        else:
             self.shutdown_event = Event()
             self.current_thread = self.get_thread(period, self.shutdown_event)
             self.current_thread.start()
@@ -135,13 +214,18 @@ class MultiSensorDevice:
             If this stops the last child then the data collection
             thread is stopped.
         """
-        if self.current_thread is None:
-            return
-
         if child in self.queues:
             del self.queues[child]
 
-        if len(self.queues) == 0:
+        if len(self.queues) > 0:
+            return
+
+        if self.current_job is not None:
+            self.scheduler.remove(self.current_job, join)
+            if join:
+                self.current_job = None
+                self.scheduler = None
+        elif self.current_thread is not None:
             self.shutdown_event.set()
             if join:
                 self.current_thread.join()
@@ -149,31 +233,23 @@ class MultiSensorDevice:
                 self.current_thread = None
         return
 
+    def get_job(self, period):
+        """Get a function to be run by a ``Scheduler`` every ``period``."""
+        reads = metrics.counter(self.metrics_name + '.reads')
+        read_time = metrics.histogram(self.metrics_name + '.read_seconds')
+
+        def job(trigger_time):
+            start = time.perf_counter()
+            self.enqueue_values(trigger_time)
+            read_time.observe(time.perf_counter() - start)
+            reads.inc()
+        return job
+
     def get_thread(self, period, shutdown_event):
         """Create a Thread object that will do the work."""
-        def run():
-            """Inner data collection loop."""
-            keep_going = True
-            while keep_going:
-                trigger_time = time.time()
-                next_trigger = trigger_time + period
-
-                if shutdown_event.is_set():
-                    keep_going = False
-                    continue
-
-                self.enqueue_values(datetime.fromtimestamp(trigger_time))
-
-                finished_time = time.time()
-                sleep_time = next_trigger - finished_time
-                LOGGER.debug('Device thread for %s: sleep=%f', self.device_name, sleep_time)
-                if sleep_time < 0:
-                    raise RuntimeError("Sensor too slow. Unable to get " +
-                                       "reading in configured period of "
-                                       "%f seconds." % period)
-                time.sleep(sleep_time)
-        thread = Thread(target=run)
-        return thread
+        job = self.get_job(period)
+        return Thread(target=run_periodic,
+                      args=(job, self.ticker, shutdown_event, self.device_name))
 
 
 class DummyMultiSensor(MultiSensorDevice):
@@ -16,7 +16,7 @@ LOGGER = logging.getLogger(__name__)
 
 class SI1145Sensor(MultiSensorDevice):
     """Adafruit SI1145 I2C UV."""
-    device_name = 'bem280'
+    device_name = 'si1145'
 
     def __init__(self, *args, **kwargs):
         super(SI1145Sensor, self).__init__(*args, **kwargs)
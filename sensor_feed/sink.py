@@ -1,24 +1,96 @@
 """Sinks for the event loop."""
+from collections import defaultdict
+from fnmatch import fnmatchcase
+from functools import lru_cache
+import itertools
+import json
 import logging
+from threading import Event, Lock, Thread
+import time
 
 try:
+    from dateutil.tz import tzlocal
     import pandas as pd
     import numpy as np
     NO_PANDAS = False
 except ImportError:
     NO_PANDAS = True
 
+try:
+    import cbor2
+    NO_CBOR = False
+except ImportError:
+    NO_CBOR = True
+
 import paho.mqtt.client as mqtt
 
+from sensor_feed import metrics
+from sensor_feed.record import Sample, get_param_name
+from sensor_feed.scheduler import Ticker, run_periodic
+from sensor_feed.spool import Spool
+
 
 LOGGER = logging.getLogger(__name__)
 
+# Number of sinks of each class named so far, for unique metric names.
+_SINK_COUNTS = defaultdict(itertools.count)
+
 
 class Sink:
+    #: Names or glob patterns of the parameters the sink receives from the
+    #: feed, None for all parameters.
+    params = None
+    #: Number of batches that may wait for the sink when run in parallel.
+    queue_size = 100
+    #: What to do with batches for the sink when its queue is full (see
+    #: ``sensor_feed.fanout``).
+    backpressure = 'block'
+
+    @property
+    def metrics_name(self):
+        """
+            Prefix for the names of the sink's metrics, unique to the sink.
+
+            The first sink of a class is named after the class, later ones
+            have a number added, e.g. ``sink.SQLiteSink_1``.
+        """
+        try:
+            return self._metrics_name
+        except AttributeError:
+            pass
+        name = type(self).__name__
+        index = next(_SINK_COUNTS[name])
+        if index:
+            name = '%s_%d' % (name, index)
+        self._metrics_name = 'sink.' + name
+        return self._metrics_name
+
+    def subscribes(self, param_name):
+        """Whether the sink should receive data for ``param_name``."""
+        if self.params is None:
+            return True
+        return any(fnmatchcase(param_name, pattern) for pattern in self.params)
+
     def process_value(self, param_name, timestamp, value):
         """Handle a single datapoint."""
         raise NotImplementedError('subclass to implement.')
 
+    def initialise(self, sensors):
+        """Prepare to receive data from ``sensors``."""
+        pass
+
+    def process_batch(self, records):
+        """
+            Handle a batch of ``Sample`` datapoints.
+
+            By default each datapoint is passed to ``process_value`` (with
+            its timestamp as a ``datetime``), subclasses can override this
+            to handle the batch in one go.
+        """
+        for sample in records:
+            self.process_value(sample.param_name, sample.timestamp,
+                               sample.value)
+
     def finalise(self):
         """Tidy-up, handle any needed serialisation, etc."""
         pass
@@ -42,27 +114,328 @@ class LoggingSink(Sink):
 
 
 class MQTTSink(Sink):
-    """Sink that logs all values."""
-    def __init__(self, broker=None, topic_root=''):
-        self.client = mqtt.Client()
-        self.client.connect(broker, 1883, 60)
+    """
+        Sink that publishes all values to an MQTT broker.
+
+        Publishing is handled by paho's background network loop so a slow
+        broker doesn't hold up the feed. At most ``max_queued`` messages
+        are waiting to be sent at any time, further messages are dropped
+        and counted in ``dropped``.
+
+        By default each value is published as its own message on
+        ``topic_root/param_name``. If ``pack`` is ``'json'`` or ``'cbor'``
+        each batch of values is instead published as one message per topic
+        holding a ``{"ts": [...], "value": [...]}`` mapping with timestamps
+        in nanoseconds since the epoch.
+
+        If ``spool_dir`` is given, messages that can't be sent because the
+        broker is unreachable (or too many are already waiting) are stored
+        in a ``Spool`` in that directory rather than dropped. Once
+        reconnected they are replayed in batches of ``replay_batch`` at up
+        to ``replay_rate`` messages per second. While there is a backlog new
+        messages are also spooled to keep them in order.
+    """
+    def __init__(self, broker=None, topic_root='', port=1883, qos=0,
+                 max_queued=1000, pack=None, spool_dir=None,
+                 segment_size=1024 * 1024, spool_max_bytes=None,
+                 replay_rate=100, replay_batch=50):
+        if pack not in (None, 'json', 'cbor'):
+            raise ValueError("Unknown MQTT packing: %s" % pack)
+        if pack == 'cbor' and NO_CBOR:
+            raise ImportError("cbor2 is required for CBOR packing.")
         self.topic_root = topic_root + '/'
+        self.qos = qos
+        self.max_queued = max_queued
+        self.pack = pack
+        self.dropped = 0
+        self.spooled = 0
+        self.connected = False
+        self.replay_rate = replay_rate
+        self.replay_batch = replay_batch
+        self._topics = {}
+        # mids of messages handed to paho but not yet sent, and of any sent
+        # before publish() returned
+        self._outstanding = set()
+        self._early = set()
+        self._mid_lock = Lock()
+
+        self.client = mqtt.Client()
+        self.client.max_queued_messages_set(max_queued)
+        self.client.on_publish = self._on_publish
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+
+        self.spool = None
+        if spool_dir is not None:
+            self.spool = Spool(spool_dir, segment_size, spool_max_bytes)
+            self._replay_wake = Event()
+            self._stop_replay = Event()
+            self._replay_thread = Thread(target=self._replay,
+                                         name='mqtt-replay')
+            self._replay_thread.start()
+
+        if self.spool is None:
+            self.client.connect(broker, port, 60)
+        else:
+            # The broker may well be unreachable at start-up.
+            self.client.connect_async(broker, port, 60)
+        self.client.loop_start()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            LOGGER.warning('MQTT connection refused: %s',
+                           mqtt.connack_string(rc))
+            return
+        self.connected = True
+        if self.spool is not None:
+            self._replay_wake.set()
+
+    def _on_disconnect(self, client, userdata, rc):
+        self.connected = False
+        # paho discards unsent QoS 0 messages when reconnecting, without
+        # calling on_publish for them, but resends QoS 1 and 2 messages
+        if self.qos == 0:
+            with self._mid_lock:
+                self._outstanding.clear()
+                self._early.clear()
+
+    def _on_publish(self, client, userdata, mid):
+        # Called from the network loop once a message has been sent.
+        with self._mid_lock:
+            try:
+                self._outstanding.remove(mid)
+            except KeyError:
+                self._early.add(mid)
+
+    def _track(self, mid):
+        """Count a message handed to paho as waiting to be sent."""
+        with self._mid_lock:
+            try:
+                self._early.remove(mid)
+            except KeyError:
+                self._outstanding.add(mid)
+
+    def _accepted(self, info):
+        """
+            Whether paho has taken a message, tracking it if so.
+
+            QoS 1 and 2 messages published while disconnected are kept by
+            paho and sent once reconnected.
+        """
+        if info.rc == mqtt.MQTT_ERR_SUCCESS or (
+                self.qos > 0 and info.rc == mqtt.MQTT_ERR_NO_CONN):
+            self._track(info.mid)
+            return True
+        return False
+
+    def _pending(self):
+        """Number of messages waiting to be sent."""
+        return len(self._outstanding)
+
+    def _topic(self, sensor_id):
+        try:
+            return self._topics[sensor_id]
+        except KeyError:
+            topic = self.topic_root + get_param_name(sensor_id)
+            self._topics[sensor_id] = topic
+            return topic
+
+    def _publish(self, topic, payload):
+        spool = self.spool
+        if spool is not None and (not self.connected or spool):
+            self._spool(topic, payload)
+            return
+        if self._pending() >= self.max_queued:
+            self._spool(topic, payload)
+            return
+        info = self.client.publish(topic, payload, self.qos)
+        if not self._accepted(info):
+            self._spool(topic, payload)
+
+    def _spool(self, topic, payload):
+        """Store a message that can't be sent, or drop it if not spooling."""
+        if self.spool is None:
+            self.dropped += 1
+        else:
+            self.spool.append(topic, payload)
+            self.spooled += 1
+
+    def _replay(self):
+        """Publish spooled messages while connected."""
+        while not self._stop_replay.is_set():
+            try:
+                self._replay_batch()
+            except Exception:
+                LOGGER.exception('Error replaying spooled MQTT messages')
+                self._stop_replay.wait(1)
+
+    def _replay_batch(self):
+        """Publish the next batch of spooled messages, if connected."""
+        if not (self.connected and self.spool):
+            self._replay_wake.wait(1)
+            self._replay_wake.clear()
+            return
+        if self._pending() >= self.max_queued:
+            self._stop_replay.wait(0.1)
+            return
+
+        batch = self.spool.peek(self.replay_batch)
+        count = 0
+        for topic, payload in batch:
+            info = self.client.publish(topic, payload, self.qos)
+            if not self._accepted(info):
+                break
+            count += 1
+        self.spool.consume(count)
+        self._stop_replay.wait(max(count, 1) / self.replay_rate)
 
     def process_value(self, param_name, timestamp, value):
         """Handle a single datapoint."""
-        topic = self.topic_root + param_name
-        self.client.publish(topic, value)
+        self.process_batch([Sample.from_value(param_name, timestamp, value)])
+
+    def process_batch(self, records):
+        """Handle a batch of datapoints."""
+        if self.pack is None:
+            publish = self._publish
+            topic = self._topic
+            for sensor_id, _, value in records:
+                publish(topic(sensor_id), value)
+            return
+
+        encode = json.dumps if self.pack == 'json' else cbor2.dumps
+        for sensor_id, (timestamps, values) in group_by_id(records).items():
+            self._publish(self._topic(sensor_id),
+                          encode({'ts': timestamps, 'value': values}))
+
+    def finalise(self):
+        """Disconnect from the broker."""
+        if self.dropped:
+            LOGGER.warning('MQTT sink dropped %d messages.', self.dropped)
+        if self.spool is not None:
+            self._stop_replay.set()
+            self._replay_wake.set()
+            self._replay_thread.join()
+        self.client.disconnect()
+        self.client.loop_stop()
+        if self.spool is not None:
+            self.spool.close()
+
+
+@lru_cache(maxsize=None)
+def freq_nanos(freq):
+    """Get the length of ``freq`` (e.g. ``'s'``, ``'5Min'``) in nanoseconds."""
+    return pd.tseries.frequencies.to_offset(freq).nanos
+
+
+def round_timestamps(timestamps, freq):
+    """
+        Round an array of timestamps to freq.
+
+        ``timestamps`` may be int64 nanoseconds since the epoch or anything
+        convertible to datetime64. Halves are rounded to even, as for
+        ``np.round``. Returns a datetime64[ns] array.
+    """
+    stamps = np.asarray(timestamps)
+    if stamps.dtype.kind in 'iu':
+        stamps = stamps.astype('i8', copy=False)
+    else:
+        stamps = stamps.astype('datetime64[ns]').view('i8')
+
+    unit = freq_nanos(freq)
+    quotient, remainder = np.divmod(stamps, unit)
+    twice = remainder * 2
+    quotient += (twice > unit) | ((twice == unit) & (quotient % 2 == 1))
+    return (quotient * unit).view('datetime64[ns]')
 
 
 def round_datetime(dtime, freq):
     """Rounds datetime to freq."""
-    freq = pd.tseries.frequencies.to_offset(freq).nanos / 1000
+    return round_timestamps(np.datetime64(dtime, 'ns'), freq)[()]
+
+
+def group_by_id(records):
+    """
+        Split ``Sample`` records by parameter id.
 
-    dtime = np.datetime64(dtime)
-    return (np.round(dtime.astype('i8') /
-                     float(freq)) * freq).astype(
-                         'datetime64[us]'
-                     ).astype('datetime64[ns]')
+        Returns a dict mapping each parameter id to a tuple of
+        (timestamps, values) lists, preserving the order of the records.
+        Timestamps are int nanoseconds since the epoch.
+    """
+    groups = {}
+    for sensor_id, timestamp, value in records:
+        try:
+            timestamps, values = groups[sensor_id]
+        except KeyError:
+            timestamps, values = groups[sensor_id] = ([], [])
+        timestamps.append(timestamp)
+        values.append(value)
+    return groups
+
+
+def group_by_param(records):
+    """As for ``group_by_id`` but keyed by parameter name."""
+    return {get_param_name(sensor_id): group
+            for sensor_id, group in group_by_id(records).items()}
+
+
+def to_series(timestamps, values, freq='s', tz=None):
+    """
+        Create a pd.Series from timestamps rounded to ``freq``, or not
+        rounded if ``freq`` is None.
+
+        ``timestamps`` may be datetimes or int64 nanoseconds since the
+        epoch. The index is in timezone ``tz`` (e.g. ``'UTC'``), or naive
+        local time if ``tz`` is None; naive datetimes are taken to already
+        be in that time. Where rounding results in duplicate timestamps the
+        last value wins.
+    """
+    stamps = np.asarray(timestamps)
+    if stamps.dtype.kind in 'iu':
+        index = pd.DatetimeIndex(stamps.astype('i8', copy=False)
+                                 .view('datetime64[ns]')).tz_localize('UTC')
+        if tz is None:
+            index = index.tz_convert(tzlocal()).tz_localize(None)
+        else:
+            index = index.tz_convert(tz)
+    else:
+        index = pd.DatetimeIndex(stamps)
+        if tz is not None and index.tz is None:
+            index = index.tz_localize(tz)
+    if freq is not None:
+        index = round_index(index, freq)
+    series = pd.Series(values, index=index, copy=False)
+    return series[~index.duplicated(keep='last')]
+
+
+def round_index(index, freq):
+    """Round a pd.DatetimeIndex to ``freq``, keeping its timezone."""
+    rounded = pd.DatetimeIndex(round_timestamps(index.asi8, freq))
+    if index.tz is not None:
+        rounded = rounded.tz_localize('UTC').tz_convert(index.tz)
+    return rounded
+
+
+def period_to_freq(period):
+    """Get a pandas frequency string for ``period`` seconds."""
+    return pd.tseries.frequencies.to_offset(
+        pd.Timedelta(seconds=period)
+    ).freqstr
+
+
+def regularise(series, freq):
+    """
+        Get ``series`` as a regular series at ``freq``.
+
+        Timestamps are rounded to multiples of ``freq`` since the epoch and
+        any gaps are filled with NaN. Where rounding results in duplicates
+        the last value wins. Returns the regular series and the number of
+        values dropped as duplicates.
+    """
+    index = round_index(series.index, freq)
+    regular = pd.Series(series.values, index=index)
+    duplicated = index.duplicated(keep='last')
+    regular = regular[~duplicated].sort_index()
+    return regular.asfreq(freq), int(duplicated.sum())
 
 
 class DataFrameSink(Sink):
@@ -72,38 +445,202 @@ class DataFrameSink(Sink):
 
     def process_value(self, param_name, timestamp, value):
         """Handle a single datapoint."""
-        self.df.ix[round_datetime(timestamp, 's'), param_name] = value
+        self.process_batch([Sample.from_value(param_name, timestamp, value)])
+
+    def process_batch(self, records):
+        """Handle a batch of datapoints."""
+        frame = pd.DataFrame({
+            param_name: to_series(timestamps, values)
+            for param_name, (timestamps, values) in group_by_param(records).items()
+        })
+        self.df = frame.combine_first(self.df)
 
     def finalise(self):
         print(self.df)
 
 
+class ParamBuffer:
+    """
+        Preallocated arrays holding buffered data for one parameter.
+
+        Timestamps are stored as int64 nanoseconds and values using the
+        parameter's dtype. ``started`` is the ``time.monotonic`` time the
+        oldest buffered value was added.
+    """
+    __slots__ = ('timestamps', 'values', 'size', 'started')
+
+    def __init__(self, capacity, dtype=float):
+        self.timestamps = np.empty(capacity, dtype='i8')
+        self.values = np.empty(capacity, dtype=dtype)
+        self.size = 0
+        self.started = None
+
+    @property
+    def capacity(self):
+        return len(self.timestamps)
+
+    @property
+    def full(self):
+        return self.size == self.capacity
+
+    @property
+    def nbytes(self):
+        """Size of the buffered data in bytes."""
+        return self.size * (self.timestamps.itemsize + self.values.itemsize)
+
+    def extend(self, timestamps, values):
+        """
+            Copy as much of ``timestamps`` and ``values`` as will fit.
+
+            Returns the number of items copied.
+        """
+        count = min(len(timestamps), self.capacity - self.size)
+        if self.size == 0 and count:
+            self.started = time.monotonic()
+        end = self.size + count
+        self.timestamps[self.size:end] = timestamps[:count]
+        self.values[self.size:end] = values[:count]
+        self.size = end
+        return count
+
+    def take(self, freq='s', tz=None):
+        """
+            Get the buffered data as a pd.Series rounded to ``freq`` and in
+            ``tz`` (see ``to_series``) and empty the buffer.
+
+            The filled part of the arrays is handed over to the series and
+            new arrays are allocated for further data.
+        """
+        series = to_series(self.timestamps[:self.size],
+                           self.values[:self.size], freq, tz)
+        self.timestamps = np.empty_like(self.timestamps)
+        self.values = np.empty_like(self.values)
+        self.size = 0
+        self.started = None
+        return series
+
+
 class BufferedSink(Sink):
     """
         A buffered sink.
 
-        Tracks each sensor-series as a pd.Series. When the series exceeds
-        buf_length values it is passed to ``write_buffer``.
+        Tracks each sensor-series in a preallocated ``ParamBuffer``. When
+        the buffer exceeds ``max_buffer`` values it is passed to
+        ``write_buffer`` as a pd.Series. The series is indexed in timezone
+        ``tz``, by default naive local time, with timestamps rounded to
+        ``freq``, by default whole seconds, or kept to the nanosecond if
+        ``freq`` is None (see ``to_series``).
 
-        ``write_buffer`` must be implemented in a subclass.
+        Buffers are also written once their oldest value is ``max_age``
+        seconds old, and all buffers are written once together they hold
+        more than ``max_bytes`` of data. Ages are checked every
+        ``check_period`` seconds (by default a quarter of ``max_age``) by a
+        timer thread started in ``initialise``, so slow sensors are
+        written without waiting for more data.
+
+        ``write_buffer`` must be implemented in a subclass. It is called
+        from the timer thread as well as the feed, but never concurrently.
     """
-    def __init__(self, max_buffer=100):
+    def __init__(self, max_buffer=100, max_age=None, max_bytes=None,
+                 check_period=None, freq='s', tz=None):
         self._buffers = {}
+        self._dtypes = {}
+        self._lock = Lock()
+        self._timer = None
+        self._timer_shutdown = Event()
         self.max_buffer = max_buffer
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.freq = freq
+        self.tz = tz
+        self._write_time = metrics.histogram(self.metrics_name + '.write_seconds')
+        self._flush_size = metrics.histogram(self.metrics_name + '.flush_size',
+                                             metrics.SIZE_BUCKETS)
+        self.check_period = check_period
+        if check_period is None and max_age is not None:
+            self.check_period = max_age / 4
+
+    def initialise(self, sensors):
+        """Use the sensors' dtypes for their buffers and start the timer."""
+        for sensor in sensors:
+            self._dtypes[sensor.param_name] = sensor.dtype
+        if self.max_age is not None and self._timer is None:
+            self._timer = Thread(
+                target=run_periodic,
+                args=(self.write_aged, Ticker(self.check_period),
+                      self._timer_shutdown, 'buffer-timer'),
+                name='buffer-timer', daemon=True,
+            )
+            self._timer.start()
 
     def process_value(self, param_name, timestamp, value):
         """Handle a single datapoint."""
-        if param_name not in self._buffers:
-            self._buffers[param_name] = pd.Series()
-        self._buffers[param_name].ix[round_datetime(timestamp, 's')] = value
+        self.process_batch([Sample.from_value(param_name, timestamp, value)])
+
+    def process_batch(self, records):
+        """
+            Handle a batch of datapoints.
+
+            Each parameter's buffer is extended once per batch, writing it
+            each time it fills.
+        """
+        with self._lock:
+            for param_name, (timestamps, values) in group_by_param(records).items():
+                try:
+                    buf = self._buffers[param_name]
+                except KeyError:
+                    buf = self._buffers[param_name] = ParamBuffer(
+                        self.max_buffer + 1, self._dtypes.get(param_name, float)
+                    )
+                timestamps = np.asarray(timestamps, dtype='i8')
+                while len(timestamps):
+                    count = buf.extend(timestamps, values)
+                    timestamps = timestamps[count:]
+                    values = values[count:]
+                    if buf.full:
+                        self._write(param_name, buf.take(self.freq, self.tz))
+
+            if self.max_bytes is not None and self.nbytes > self.max_bytes:
+                LOGGER.debug('Buffers over %d bytes, writing', self.max_bytes)
+                self._write_all()
+
+    @property
+    def nbytes(self):
+        """Total size of the buffered data in bytes."""
+        return sum(buf.nbytes for buf in self._buffers.values())
+
+    def write_aged(self, timestamp=None):
+        """Write any buffers with data older than ``max_age``."""
+        oldest = time.monotonic() - self.max_age
+        with self._lock:
+            for param_name, buf in self._buffers.items():
+                if buf.size and buf.started <= oldest:
+                    try:
+                        self._write(param_name, buf.take(self.freq, self.tz))
+                    except Exception:
+                        LOGGER.exception('Unable to write %s', param_name)
+
+    def _write(self, param_name, series):
+        """Pass ``series`` to ``write_buffer``, recording metrics."""
+        self._flush_size.observe(len(series))
+        start = time.perf_counter()
+        self.write_buffer(param_name, series)
+        self._write_time.observe(time.perf_counter() - start)
 
-        if len(self._buffers[param_name]) > self.max_buffer:
-            self.write_buffer(param_name, self._buffers[param_name])
-            del self._buffers[param_name]
+    def _write_all(self):
+        """Write all non-empty buffers."""
+        for param_name, buf in self._buffers.items():
+            if buf.size:
+                self._write(param_name, buf.take(self.freq, self.tz))
 
     def finalise(self):
-        for param_name in self._buffers:
-            self.write_buffer(param_name, self._buffers[param_name])
+        """Stop the timer and write any buffered data."""
+        if self._timer is not None:
+            self._timer_shutdown.set()
+            self._timer.join()
+            self._timer = None
+        with self._lock:
+            self._write_all()
 
 
 class PrintingBufferSink(BufferedSink):
@@ -0,0 +1,148 @@
+"""A sink writing rolling Parquet files."""
+import logging
+import os
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from sensor_feed.sink import BufferedSink
+
+
+LOGGER = logging.getLogger(__name__)
+
+DAY_NANOS = 24 * 60 * 60 * 10**9
+
+
+class ParquetFile:
+    """
+        An open Parquet file receiving one parameter's data for one day.
+
+        ``opened`` is the ``time.monotonic`` time the file was opened.
+    """
+    __slots__ = ('path', 'day', 'writer', 'rows', 'opened')
+
+    def __init__(self, path, day, schema, compression):
+        self.path = path
+        self.day = day
+        self.writer = pq.ParquetWriter(path, schema, compression=compression)
+        self.rows = 0
+        self.opened = time.monotonic()
+
+    def write(self, batch):
+        """Write ``batch`` as a row group."""
+        self.writer.write_batch(batch)
+        self.rows += batch.num_rows
+
+    def close(self):
+        self.writer.close()
+
+
+class ParquetSink(BufferedSink):
+    """
+        A buffered sink writing rolling Parquet files.
+
+        Files are partitioned by parameter and (UTC) day as::
+
+            <directory>/param=<param_name>/date=<YYYY-MM-DD>/part-<ts>.parquet
+
+        so the directory can be read as a hive partitioned dataset, e.g.
+        with ``pd.read_parquet(directory)``. Each file has columns ``ts``,
+        ``param`` (dictionary-encoded) and ``value``. Each written buffer
+        is a row group. A file is closed, and so becomes readable, at the
+        end of its day, once it holds ``rows_per_file`` rows, once it has
+        been open ``max_file_age`` seconds or when the sink is finalised.
+
+        A file has no footer until it is closed, so a crash or power cut
+        loses the files that are open: up to ``max_file_age`` seconds of
+        each parameter's data, as well as any data still buffered (see
+        ``BufferedSink``). Open files are checked for age as data is
+        written and, if ``max_age`` is set, by the buffer timer.
+    """
+    def __init__(self, directory, *args, compression='snappy',
+                 rows_per_file=100000, max_file_age=3600, **kwargs):
+        # timestamps are stored as UTC nanoseconds, without rounding
+        kwargs.setdefault('freq', None)
+        kwargs.setdefault('tz', 'UTC')
+        super(ParquetSink, self).__init__(*args, **kwargs)
+        self.directory = directory
+        self.compression = compression
+        self.rows_per_file = rows_per_file
+        self.max_file_age = max_file_age
+        # open file for each parameter
+        self._files = {}
+
+    def write_buffer(self, param_name, series):
+        """Write a buffer of data, splitting it at day boundaries."""
+        if len(series) == 0:
+            return
+
+        series = series.sort_index()
+        days = series.index.asi8 // DAY_NANOS
+        splits = np.flatnonzero(np.diff(days)) + 1
+        starts = np.concatenate(([0], splits))
+        ends = np.concatenate((splits, [len(days)]))
+        for start, end in zip(starts, ends):
+            self._write_day(param_name, int(days[start]),
+                            series.iloc[start:end])
+
+    def _write_day(self, param_name, day, series):
+        """Write ``series`` (all within ``day``) to the parameter's file."""
+        batch = pa.RecordBatch.from_arrays([
+            pa.array(series.index),
+            pa.DictionaryArray.from_arrays(
+                np.zeros(len(series), dtype='i4'), pa.array([param_name])
+            ),
+            pa.array(series.values),
+        ], names=['ts', 'param', 'value'])
+
+        pfile = self._files.get(param_name)
+        if pfile is not None and (pfile.day != day or
+                                  pfile.rows >= self.rows_per_file or
+                                  self._aged(pfile)):
+            self._close(param_name)
+            pfile = None
+        if pfile is None:
+            pfile = self._files[param_name] = self._open(
+                param_name, day, series.index.asi8[0], batch.schema
+            )
+        pfile.write(batch)
+
+    def _open(self, param_name, day, first_ts, schema):
+        """Open a new file for ``param_name`` on ``day``."""
+        directory = os.path.join(
+            self.directory, 'param=%s' % param_name,
+            'date=%s' % np.datetime64(day, 'D'),
+        )
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, 'part-%d.parquet' % first_ts)
+        LOGGER.debug('Opening %s', path)
+        return ParquetFile(path, day, schema, self.compression)
+
+    def _aged(self, pfile):
+        """Whether ``pfile`` has been open for ``max_file_age``."""
+        return (self.max_file_age is not None and
+                time.monotonic() - pfile.opened >= self.max_file_age)
+
+    def write_aged(self, timestamp=None):
+        """Write any aged buffers, then close any aged files."""
+        super(ParquetSink, self).write_aged(timestamp)
+        with self._lock:
+            for param_name, pfile in list(self._files.items()):
+                if self._aged(pfile):
+                    self._close(param_name)
+
+    def _close(self, param_name):
+        """Close the open file for ``param_name``."""
+        pfile = self._files.pop(param_name)
+        LOGGER.debug('Closing %s with %d rows', pfile.path, pfile.rows)
+        pfile.close()
+
+    def finalise(self):
+        """Write any buffered data and close all open files."""
+        try:
+            super(ParquetSink, self).finalise()
+        finally:
+            for param_name in list(self._files):
+                self._close(param_name)
@@ -1,16 +1,33 @@
 """A sink using the PhilDB timeseries database."""
+import logging
+from queue import Queue
+from threading import Thread
+
 from phildb.create import create
 from phildb.exceptions import AlreadyExistsError, DuplicateError
 from phildb.database import PhilDB
 
-from sensor_feed.sink import BufferedSink
+from sensor_feed.sink import BufferedSink, period_to_freq, regularise
+
+
+LOGGER = logging.getLogger(__name__)
 
 
 class PhilDBSink(BufferedSink):
     """
         A buffered sink using the PhilDB timeseries database.
+
+        Each parameter is stored at the frequency of its sensor's period,
+        with each buffer rounded onto that frequency before being written.
+        Sensors should be ``aligned`` so their readings stay on that grid.
+        Readings that round to the same time as a later one are dropped and
+        counted in ``collisions``.
+        Writes are made by a dedicated writer thread so a slow write doesn't
+        hold up the feed. Up to ``max_pending`` buffers can be waiting to be
+        written, after which ``write_buffer`` blocks until the writer
+        catches up.
     """
-    def __init__(self, dbfile, *args, **kwargs):
+    def __init__(self, dbfile, *args, max_pending=10, **kwargs):
         super(PhilDBSink, self).__init__(*args, **kwargs)
 
         try:
@@ -19,17 +36,89 @@ class PhilDBSink(BufferedSink):
             pass # Database already exists, so no creation required.
 
         self.db = PhilDB(dbfile)
-        self.last_known_freq = None
         try:
             self.db.add_source('SENSOR', 'Data from hardware sensor')
         except DuplicateError:
             pass # DuplicateError means the source already existed
 
+        self.collisions = 0
+        # frequency of each parameter, from the sensor period
+        self._freqs = {}
+        # (param_name, freq) pairs known to be in the database.
+        self._registered = set()
+        self._writes = Queue(maxsize=max_pending)
+        self._writer = Thread(target=self._write_loop, name='phildb-writer',
+                              daemon=True)
+        self._writer.start()
+
+    def initialise(self, sensors):
+        """
+            Note the frequency of each sensor's parameter, warning of any
+            sensors that aren't aligned.
+        """
+        super(PhilDBSink, self).initialise(sensors)
+        for sensor in sensors:
+            if not self.subscribes(sensor.param_name):
+                continue
+            if not getattr(sensor, 'aligned', False):
+                LOGGER.warning('%s is not aligned, so readings may collide '
+                               'when stored. Set aligned for it.',
+                               sensor.param_name)
+            if sensor.period is not None:
+                self._freqs[sensor.param_name] = period_to_freq(sensor.period)
+
+    def get_freq(self, param_name, series):
+        """
+            Get the frequency to store ``param_name`` at.
+
+            Parameters not from a known sensor have their frequency inferred
+            from the first buffer it can be inferred from. Returns None if
+            the frequency is not yet known.
+        """
+        freq = self._freqs.get(param_name)
+        if freq is None and len(series) > 2:
+            freq = series.index.inferred_freq
+            if freq is not None:
+                self._freqs[param_name] = freq
+        return freq
+
     def write_buffer(self, param_name, series):
-        """Write buffer of data to database."""
+        """Queue a buffer of data to be written to the database."""
         if len(series) == 0:
             return
 
+        freq = self.get_freq(param_name, series)
+        if freq is None:
+            LOGGER.error('Unable to determine frequency of %s, dropping %d '
+                         'values', param_name, len(series))
+            return
+
+        regular, collisions = regularise(series, freq)
+        if collisions:
+            self.collisions += collisions
+            LOGGER.warning('Dropped %d values of %s with the same time at %s',
+                           collisions, param_name, freq)
+        self._writes.put((param_name, freq, regular))
+
+    def _write_loop(self):
+        """Write queued buffers until told to stop with None."""
+        while True:
+            item = self._writes.get()
+            if item is None:
+                return
+            param_name, freq, series = item
+            try:
+                self._register(param_name, freq)
+                self.db.write(param_name, freq, series, measurand=param_name,
+                              source='SENSOR')
+            except Exception:
+                LOGGER.exception('Unable to write %s to PhilDB', param_name)
+
+    def _register(self, param_name, freq):
+        """Make sure the timeseries instance exists in the database."""
+        if (param_name, freq) in self._registered:
+            return
+
         try:
             self.db.add_measurand(param_name, param_name, param_name)
         except DuplicateError:
@@ -40,18 +129,6 @@ class PhilDBSink(BufferedSink):
         except DuplicateError:
             pass # DuplicateError means the timeseries already existed
 
-        freq = series.index.inferred_freq
-        # need to handle special case where only one value being written
-        # unable to calculate the frequency so we use the last known
-        # value which in general should always be the same.
-        if len(series) == 1:
-            freq = self.last_known_freq
-        elif freq is not None:
-            self.last_known_freq = freq
-
-        if freq is None:
-            raise ValueError('Unable to determine sensor frequency')
-
         try:
             self.db.add_timeseries_instance(param_name, freq, 'None',
                                             measurand=param_name,
@@ -59,4 +136,12 @@ class PhilDBSink(BufferedSink):
         except DuplicateError:
             pass # DuplicateError - the timeseries instance already existed
 
-        self.db.write(param_name, freq, series, measurand=param_name, source='SENSOR')
+        self._registered.add((param_name, freq))
+
+    def finalise(self):
+        """Write any buffered data and wait for the writer to finish."""
+        try:
+            super(PhilDBSink, self).finalise()
+        finally:
+            self._writes.put(None)
+            self._writer.join()
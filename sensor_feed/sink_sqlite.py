@@ -0,0 +1,87 @@
+"""A sink using an SQLite database."""
+from itertools import repeat
+import logging
+import sqlite3
+
+from sensor_feed.sink import BufferedSink
+
+
+LOGGER = logging.getLogger(__name__)
+
+#: Database schema. Readings are keyed (and so clustered) on parameter and
+#: timestamp, making the primary key a covering index for time range
+#: queries on a parameter.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS param (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS reading (
+    param_id INTEGER NOT NULL REFERENCES param (id),
+    ts INTEGER NOT NULL,
+    value REAL,
+    PRIMARY KEY (param_id, ts)
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteSink(BufferedSink):
+    """
+        A buffered sink writing to an SQLite database.
+
+        Readings are stored as (param_id, ts, value) rows with ``ts`` in
+        nanoseconds since the epoch; parameter names are in the ``param``
+        table. The database is used in WAL mode and each buffer is inserted
+        with one ``executemany`` in a transaction of its own, so
+        ``max_buffer`` trades durability for throughput. ``synchronous``
+        sets the SQLite synchronous pragma.
+    """
+    def __init__(self, dbfile, *args, synchronous='NORMAL', **kwargs):
+        # timestamps are stored as UTC nanoseconds, without rounding
+        kwargs.setdefault('freq', None)
+        kwargs.setdefault('tz', 'UTC')
+        super(SQLiteSink, self).__init__(*args, **kwargs)
+        self.conn = sqlite3.connect(dbfile, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=%s' % synchronous)
+        self.conn.executescript(SCHEMA)
+        self._param_ids = dict(self.conn.execute('SELECT name, id FROM param'))
+
+    def initialise(self, sensors):
+        """Make sure the sensors' parameters are in the database."""
+        super(SQLiteSink, self).initialise(sensors)
+        for sensor in sensors:
+            self.get_param_id(sensor.param_name)
+
+    def get_param_id(self, param_name):
+        """Get the id of ``param_name``, adding it if needed."""
+        try:
+            return self._param_ids[param_name]
+        except KeyError:
+            pass
+
+        with self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO param (name) VALUES (?)',
+                              (param_name,))
+        param_id, = self.conn.execute('SELECT id FROM param WHERE name = ?',
+                                      (param_name,)).fetchone()
+        self._param_ids[param_name] = param_id
+        return param_id
+
+    def write_buffer(self, param_name, series):
+        """Write a buffer of data in one transaction."""
+        rows = zip(repeat(self.get_param_id(param_name)),
+                   series.index.asi8.tolist(), series.values.tolist())
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO reading (param_id, ts, value) '
+                'VALUES (?, ?, ?)', rows
+            )
+        LOGGER.debug('Wrote %d rows of %s', len(series), param_name)
+
+    def finalise(self):
+        """Write any buffered data and close the database."""
+        try:
+            super(SQLiteSink, self).finalise()
+        finally:
+            self.conn.close()
@@ -0,0 +1,165 @@
+"""
+A disk-backed store-and-forward spool.
+
+Messages that can't be sent straight away (for example while an MQTT
+broker is unreachable) are appended to a log on disk. The log is split
+into segment files which are deleted once every message in them has been
+read back and consumed.
+
+Each message is stored as a little-endian header of the topic and payload
+lengths followed by the topic and payload bytes. A new segment is always
+started when a spool is opened so that a partly written message at the end
+of a segment (e.g. after a power cut) is never followed by good data.
+Delivery is at-least-once: messages read but not consumed before a restart
+are read again.
+"""
+from collections import deque
+import glob
+import logging
+import os
+import struct
+from threading import Lock
+
+
+LOGGER = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('<II')
+_SUFFIX = '.spool'
+
+
+def to_bytes(payload):
+    """Convert an MQTT style payload to bytes."""
+    if isinstance(payload, bytes):
+        return payload
+    if isinstance(payload, str):
+        return payload.encode('utf-8')
+    return str(payload).encode('ascii')
+
+
+class Spool:
+    """
+        An append-only log of ``(topic, payload)`` messages in
+        ``directory``.
+
+        A new segment file is started once the current one reaches
+        ``segment_size`` bytes. If ``max_bytes`` is given the oldest
+        segments are deleted (losing their messages) to keep the spool
+        below that size.
+    """
+    def __init__(self, directory, segment_size=1024 * 1024, max_bytes=None):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = Lock()
+        self._segments = deque(sorted(glob.glob(
+            os.path.join(directory, '*' + _SUFFIX)
+        )))
+        self._size = sum(os.path.getsize(fname) for fname in self._segments)
+        self._read_pos = 0
+        self._peeked = []
+        self._writer = None
+        self._written = 0
+        self._new_segment()
+
+    def __bool__(self):
+        """True if there are messages waiting to be read."""
+        with self._lock:
+            return self._size > self._read_pos
+
+    def _new_segment(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._segments:
+            number = int(os.path.basename(self._segments[-1])[:-len(_SUFFIX)]) + 1
+        else:
+            number = 0
+        fname = os.path.join(self.directory, '%020d%s' % (number, _SUFFIX))
+        self._segments.append(fname)
+        self._writer = open(fname, 'ab')
+        self._written = 0
+
+    def append(self, topic, payload):
+        """Add a message to the end of the spool."""
+        topic = topic.encode('utf-8')
+        payload = to_bytes(payload)
+        record = _HEADER.pack(len(topic), len(payload)) + topic + payload
+        with self._lock:
+            if self._written >= self.segment_size:
+                self._new_segment()
+            self._writer.write(record)
+            self._writer.flush()
+            self._written += len(record)
+            self._size += len(record)
+            if self.max_bytes is not None:
+                while self._size > self.max_bytes and len(self._segments) > 1:
+                    LOGGER.warning('Spool full, dropping %s', self._segments[0])
+                    self._drop_oldest()
+
+    def peek(self, max_messages):
+        """
+            Read up to ``max_messages`` messages from the start of the spool
+            without removing them. Messages are only read from one segment
+            at a time.
+
+            Returns a list of ``(topic, payload)`` tuples, with the topic as
+            a str and the payload as bytes. Pass the number of messages
+            that have been dealt with to ``consume``.
+        """
+        with self._lock:
+            self._peeked = []
+            messages = []
+            while self._segments and not messages:
+                fname = self._segments[0]
+                with open(fname, 'rb') as segment:
+                    segment.seek(self._read_pos)
+                    while len(messages) < max_messages:
+                        header = segment.read(_HEADER.size)
+                        if len(header) < _HEADER.size:
+                            break
+                        topic_len, payload_len = _HEADER.unpack(header)
+                        body = segment.read(topic_len + payload_len)
+                        if len(body) < topic_len + payload_len:
+                            break
+                        messages.append((body[:topic_len].decode('utf-8'),
+                                         body[topic_len:]))
+                        self._peeked.append(segment.tell())
+                if messages or fname == self._writer.name:
+                    break
+                # Finished with this segment.
+                self._drop_oldest()
+            return messages
+
+    def consume(self, count):
+        """
+            Remove the first ``count`` messages returned by ``peek``.
+
+            Does nothing if the segment they were read from has since been
+            dropped to keep within ``max_bytes``.
+        """
+        if count == 0:
+            return
+        with self._lock:
+            if count > len(self._peeked):
+                LOGGER.debug('Segment dropped since peek, nothing to consume')
+                return
+            self._read_pos = self._peeked[count - 1]
+            self._peeked = []
+
+    def _drop_oldest(self):
+        # Never called for the segment being written.
+        fname = self._segments.popleft()
+        self._size -= os.path.getsize(fname)
+        os.remove(fname)
+        self._read_pos = 0
+        self._peeked = []
+
+    def close(self):
+        """Close the spool, keeping any unread messages on disk."""
+        with self._lock:
+            self._writer.close()
+            # Don't leave empty segments lying around.
+            for fname in list(self._segments):
+                if os.path.getsize(fname) == 0:
+                    os.remove(fname)
@@ -0,0 +1,78 @@
+"""Tests for sensor_feed.aggregate."""
+import unittest
+
+from sensor_feed.aggregate import AggregatingSink
+from sensor_feed.record import Sample
+from sensor_feed.sensor import ConstantSensor
+from sensor_feed.sink import Sink
+
+
+class RecordingSink(Sink):
+    def __init__(self):
+        self.values = []
+        self.sensors = None
+        self.finalised = False
+
+    def initialise(self, sensors):
+        self.sensors = sensors
+
+    def process_value(self, param_name, timestamp, value):
+        self.values.append((param_name, timestamp, value))
+
+    def process_batch(self, records):
+        self.values.extend((sample.param_name, sample.ts, sample.value)
+                           for sample in records)
+
+    def finalise(self):
+        self.finalised = True
+
+
+class AggregatingSinkTestCase(unittest.TestCase):
+    def test_bad_stat(self):
+        with self.assertRaises(ValueError):
+            AggregatingSink(RecordingSink(), stats=('mean', 'median'))
+
+    def test_initialise(self):
+        sink = RecordingSink()
+        agg = AggregatingSink(sink, window=60, stats=('mean', 'count'))
+        agg.initialise([ConstantSensor(name='temp')])
+        self.assertEqual([(param.param_name, param.dtype, param.period)
+                          for param in sink.sensors],
+                         [('temp_mean', float, 60), ('temp_count', int, 60)])
+
+    def test_windows(self):
+        sink = RecordingSink()
+        agg = AggregatingSink(sink, window=10)
+        start = 1457153640 * 10**9
+        agg.process_batch([
+            Sample.from_value('agg_a', start + sec * 10**9, value)
+            for sec, value in enumerate([3., 1., 4., 1., 5., 9., 2., 6., 5.])
+        ])
+        self.assertEqual(sink.values, [])
+
+        agg.process_batch([
+            Sample.from_value('agg_a', start + 11 * 10**9, 7.),
+            # late, so ignored
+            Sample.from_value('agg_a', start + 5 * 10**9, 100.),
+            Sample.from_value('agg_a', start + 12 * 10**9, 3.),
+        ])
+        self.assertEqual(sink.values, [
+            ('agg_a_min', start, 1.),
+            ('agg_a_max', start, 9.),
+            ('agg_a_mean', start, 4.),
+            ('agg_a_count', start, 9),
+            ('agg_a_last', start, 5.),
+        ])
+        self.assertEqual(agg.late, 1)
+
+        del sink.values[:]
+        agg.finalise()
+        self.assertTrue(sink.finalised)
+        start += 10 * 10**9
+        self.assertEqual(sink.values, [
+            ('agg_a_min', start, 3.),
+            ('agg_a_max', start, 7.),
+            ('agg_a_mean', start, 5.),
+            ('agg_a_count', start, 2),
+            ('agg_a_last', start, 3.),
+        ])
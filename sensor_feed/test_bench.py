@@ -0,0 +1,112 @@
+"""Tests for sensor_feed.bench."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from sensor_feed import bench
+from sensor_feed.__main__ import get_parser
+from sensor_feed.config import SensorConfig
+
+
+CONFIG = """
+sensor_defaults:
+  period: 5
+sensors:
+  - class: ConstantSensor
+    kwargs:
+      name: bench_constant
+  - class: sensor_feed.sensor_adc.AdcPollSensor
+    period: 1
+    kwargs:
+      param_name: bench_soil
+      dtype: int
+  - class: sensor_feed.sensor_bme280.BME280Sensor
+    param_names: [bench_temp, bench_rhum]
+sinks:
+  - class: LoggingSink
+"""
+
+
+class BenchTestCase(unittest.TestCase):
+    def test_run_benchmark(self):
+        result = bench.run_benchmark(bench.synthetic_sensors(3, 0.05),
+                                     bench.NullSink(), 0.5)
+        self.assertGreater(result['readings'], 0)
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertGreater(result['peak_rss_mb'], 0)
+
+    def test_run_sinks(self):
+        specs = [('bench_a', 0.05, float), ('bench_b', 0.1, int)]
+        results = bench.run_sinks(['aggregate', 'sqlite'], specs, 0.3,
+                                  isolate=False)
+        self.assertEqual(list(results), ['aggregate', 'sqlite'])
+        report = bench.format_report(results).splitlines()
+        self.assertEqual(len(report), 3)
+        self.assertTrue(report[2].startswith('sqlite'))
+
+    def test_unknown_sink(self):
+        with self.assertRaises(ValueError):
+            bench.create_sink('printer', '/tmp')
+
+
+class BenchConfigTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.fname = os.path.join(directory, 'config.yaml')
+        with open(self.fname, 'w') as config_file:
+            config_file.write(CONFIG)
+
+    def test_describe_sensors(self):
+        config = SensorConfig(self.fname)
+        # the ADC sensor can't be created without its hardware library, so
+        # is described from the config
+        with self.assertLogs('sensor_feed.config', 'WARNING'):
+            self.assertEqual(config.describe_sensors(10), [
+                ('bench_constant', 5, float),
+                ('bench_soil', 1, 'int'),
+                ('bench_temp', 5, float),
+                ('bench_rhum', 5, float),
+            ])
+
+    def test_describe_unknown_params(self):
+        with open(self.fname, 'w') as config_file:
+            config_file.write(
+                "sensors:\n"
+                "  - class: sensor_feed.sensor_si1145.SI1145Sensor\n"
+            )
+        config = SensorConfig(self.fname)
+        with self.assertRaises(ValueError):
+            config.describe_sensors(10)
+
+    def test_bench_config(self):
+        args = get_parser().parse_args([
+            '--config', self.fname, 'bench', '--duration', '10',
+            '--speedup', '20', '--sinks', 'null,aggregate',
+        ])
+        report = bench.bench_config(args).splitlines()
+        self.assertEqual([line.split()[0] for line in report[1:]],
+                         ['NullSink', 'AggregatingSink'])
+        # 0.5s of 20 readings per second of the soil stand-in
+        self.assertGreaterEqual(int(report[1].split()[1]), 5)
+
+    def test_configured_sinks_sandboxed(self):
+        archive = os.path.join(os.path.dirname(self.fname), 'archive.db')
+        with open(self.fname, 'a') as config_file:
+            config_file.write(
+                "  - class: sensor_feed.sink_sqlite.SQLiteSink\n"
+                "    kwargs:\n"
+                "      dbfile: %s\n"
+                "  - class: MQTTSink\n"
+                "    kwargs:\n"
+                "      broker: broker.invalid\n" % archive
+            )
+        args = get_parser().parse_args([
+            '--config', self.fname, 'bench', '--duration', '10',
+            '--speedup', '20',
+        ])
+        report = bench.bench_config(args).splitlines()
+        self.assertEqual([line.split()[0] for line in report[1:]],
+                         ['LoggingSink', 'SQLiteSink', 'NullSink'])
+        self.assertFalse(os.path.exists(archive))
@@ -0,0 +1,88 @@
+"""Tests for sensor_feed.fanout."""
+from threading import Event
+import unittest
+
+from sensor_feed.fanout import SinkWorker
+from sensor_feed.feed import SensorFeed
+from sensor_feed.sensor import ConstantSensor
+from sensor_feed.sink import Sink
+
+
+class BlockedSink(Sink):
+    """Sink that waits for ``release`` before handling each batch."""
+    def __init__(self):
+        self.release = Event()
+        self.started = Event()
+        self.batches = []
+
+    def process_batch(self, records):
+        self.started.set()
+        self.release.wait()
+        self.batches.append(list(records))
+
+
+class FailingSink(Sink):
+    def process_batch(self, records):
+        raise RuntimeError('Sink failure')
+
+
+class SinkWorkerTestCase(unittest.TestCase):
+    def fill(self, backpressure):
+        sink = BlockedSink()
+        worker = SinkWorker(sink, queue_size=2, backpressure=backpressure)
+        worker.start()
+        worker.process_batch([0])
+        sink.started.wait(1)
+        # the sink is now busy with [0], so the queue fills
+        for value in range(1, 5):
+            worker.process_batch([value, value])
+        sink.release.set()
+        worker.stop()
+        return sink, worker
+
+    def test_bad_policy(self):
+        with self.assertRaises(ValueError):
+            SinkWorker(Sink(), backpressure='sometimes')
+
+    def test_drop_oldest(self):
+        sink, worker = self.fill('drop-oldest')
+        self.assertEqual(sink.batches, [[0], [3, 3, 4, 4]])
+        self.assertEqual(worker.dropped, 4)
+
+    def test_drop_newest(self):
+        sink, worker = self.fill('drop-newest')
+        self.assertEqual(sink.batches, [[0], [1, 1, 2, 2]])
+        self.assertEqual(worker.dropped, 4)
+
+    def test_errors(self):
+        worker = SinkWorker(FailingSink())
+        worker.start()
+        with self.assertLogs('sensor_feed.fanout', 'ERROR'):
+            worker.process_batch([1])
+            worker.stop()
+        self.assertEqual(worker.errors, 1)
+
+
+class ParallelFeedTestCase(unittest.TestCase):
+    def test_failing_sink(self):
+        class RecordingSink(Sink):
+            def __init__(self):
+                self.values = []
+
+            def process_batch(self, records):
+                self.values.extend(records)
+
+        sink = RecordingSink()
+        feed = SensorFeed([ConstantSensor(value=3)], [FailingSink(), sink],
+                          0.1, fanout='parallel')
+        with self.assertLogs('sensor_feed.fanout', 'ERROR'):
+            feed.start_sensors()
+            try:
+                count = 0
+                while count < 2:
+                    count += feed.process_pending(timeout=1)
+            finally:
+                feed.stop_sensors()
+                feed.finalise_sinks()
+        self.assertEqual(len(sink.values), count)
+        self.assertGreaterEqual(feed.workers[0].errors, 1)
@@ -0,0 +1,138 @@
+"""Tests for sensor_feed.feed."""
+from datetime import datetime
+import time
+import unittest
+
+from sensor_feed.feed import Router, SensorFeed
+from sensor_feed.ingest import IngestQueue
+from sensor_feed.record import Sample, register_param
+from sensor_feed.sensor import ConstantSensor
+from sensor_feed.sink import Sink
+
+
+class RecordingSink(Sink):
+    def __init__(self):
+        self.values = []
+
+    def process_value(self, param_name, timestamp, value):
+        self.values.append((param_name, timestamp, value))
+
+
+class SensorFeedTestCase(unittest.TestCase):
+    def test_bad_dispatch(self):
+        with self.assertRaises(ValueError):
+            SensorFeed([], [], 1, dispatch='sometimes')
+
+    def test_event_dispatch(self):
+        sink = RecordingSink()
+        feed = SensorFeed([ConstantSensor(value=3)], [sink], 0.2)
+        feed.start_sensors()
+        try:
+            start = time.time()
+            feed.process_pending(timeout=1)
+            elapsed = time.time() - start
+        finally:
+            feed.stop_sensors()
+        self.assertLess(elapsed, 1)
+        self.assertEqual(sink.values[0][0], 'constant')
+        self.assertEqual(sink.values[0][2], 3)
+
+    def test_single_ingest_queue(self):
+        sink = RecordingSink()
+        sensors = [ConstantSensor(value=1, name='one'),
+                   ConstantSensor(value=2, name='two')]
+        feed = SensorFeed(sensors, [sink], 0.2)
+        feed.start_sensors()
+        try:
+            count = 0
+            while count < 2:
+                count += feed.process_pending(timeout=1)
+        finally:
+            feed.stop_sensors()
+        self.assertEqual(sorted((name, value) for name, _, value in sink.values),
+                         [('one', 1), ('two', 2)])
+
+    def test_sensor_period(self):
+        sensors = [ConstantSensor(name='fast'), ConstantSensor(name='slow')]
+        sensors[1].period = 5
+        feed = SensorFeed(sensors, [RecordingSink()], 0.2)
+        feed.start_sensors()
+        try:
+            self.assertEqual([sensor.period for sensor in sensors], [0.2, 5])
+        finally:
+            feed.stop_sensors()
+
+
+class RouterTestCase(unittest.TestCase):
+    def test_routes(self):
+        everything = RecordingSink()
+        cpu = RecordingSink()
+        cpu.params = ['route_cpu*']
+        soil = RecordingSink()
+        soil.params = ('route_soil',)
+        router = Router([cpu, everything, soil])
+        router.build(['route_cpu0', 'route_soil'])
+
+        records = [Sample.from_value(name, 10**18, value)
+                   for value, name in enumerate(['route_cpu0', 'route_soil',
+                                                 'route_cpu1', 'route_other'])]
+        router.process_batch(records)
+        self.assertEqual([value for _, _, value in everything.values],
+                         [0, 1, 2, 3])
+        self.assertEqual([name for name, _, _ in cpu.values],
+                         ['route_cpu0', 'route_cpu1'])
+        self.assertEqual([name for name, _, _ in soil.values], ['route_soil'])
+
+    def test_unsubscribed(self):
+        class FailingSink(RecordingSink):
+            params = ['route_none']
+
+            def process_batch(self, records):
+                raise AssertionError('Unexpected data')
+
+        router = Router([FailingSink()])
+        router.process_batch([Sample.from_value('route_x', 10**18, 1)])
+
+
+class IngestQueueTestCase(unittest.TestCase):
+    def fill(self, overflow):
+        ingest = IngestQueue(3, overflow)
+        first = ingest.sensor_queue(1)
+        second = ingest.sensor_queue(2)
+        for value in range(3):
+            first.put((value, value))
+        second.put((3, 3))
+        second.put((4, 4))
+        return ingest, [sample.value for sample in ingest.drain()]
+
+    def test_bad_overflow(self):
+        with self.assertRaises(ValueError):
+            IngestQueue(3, 'sometimes')
+
+    def test_drop_oldest(self):
+        ingest, values = self.fill('drop-oldest')
+        self.assertEqual(values, [2, 3, 4])
+        self.assertEqual(ingest.dropped, {1: 2})
+
+    def test_drop_newest(self):
+        ingest, values = self.fill('drop-newest')
+        self.assertEqual(values, [0, 1, 2])
+        self.assertEqual(ingest.dropped, {2: 2})
+
+    def test_feed_dropped(self):
+        feed = SensorFeed([], [], 1, queue_size=1, overflow='drop-newest')
+        handle = feed.ingest.sensor_queue(register_param('dropping'))
+        handle.put((0, 1))
+        handle.put((1, 2))
+        self.assertEqual(feed.dropped(), {'dropping': 1})
+
+
+class SampleTestCase(unittest.TestCase):
+    def test_sample(self):
+        stamp = datetime(2016, 3, 5, 4, 53, 43, 32)
+        sample = Sample.from_value('Norwegian Blue', stamp, 5)
+        self.assertEqual(sample.param_name, 'Norwegian Blue')
+        self.assertEqual(sample.ts, int(stamp.timestamp()) * 10**9 + 32000)
+        self.assertEqual(sample.timestamp, stamp)
+        self.assertEqual(Sample.from_value('Norwegian Blue', sample.ts, 1).sensor_id,
+                         sample.sensor_id)
@@ -0,0 +1,96 @@
+"""Tests for sensor_feed.metrics."""
+import unittest
+
+from sensor_feed import metrics
+from sensor_feed.fanout import SinkWorker
+from sensor_feed.feed import SensorFeed
+from sensor_feed.sensor import ConstantSensor
+from sensor_feed.sensor_multi import DummyMultiSensor
+from sensor_feed.sink import BufferedSink, Sink
+
+
+class RegistryTestCase(unittest.TestCase):
+    def test_counter(self):
+        registry = metrics.Registry()
+        registry.counter('events').inc()
+        registry.counter('events').inc(2)
+        self.assertEqual(registry.snapshot(), {'events': 3})
+
+    def test_wrong_kind(self):
+        registry = metrics.Registry()
+        registry.counter('events')
+        with self.assertRaises(TypeError):
+            registry.histogram('events')
+
+    def test_histogram(self):
+        registry = metrics.Registry()
+        hist = registry.histogram('sizes', (1, 10, 100))
+        for value in [1] * 50 + [5] * 49 + [1000]:
+            hist.observe(value)
+        self.assertEqual(hist.counts, [50, 49, 0, 1])
+        self.assertEqual(registry.snapshot()['sizes'], {
+            'count': 100, 'mean': 12.95, 'p50': 1, 'p99': 10,
+        })
+        self.assertEqual(hist.percentile(100), float('inf'))
+
+    def test_gauge(self):
+        registry = metrics.Registry()
+        values = []
+        registry.gauge('length', lambda: len(values))
+        values.append(1)
+        self.assertEqual(registry.format(), 'length 1')
+
+
+class InstrumentationTestCase(unittest.TestCase):
+    def test_feed(self):
+        written = []
+
+        class ListBufferSink(BufferedSink):
+            def write_buffer(self, param_name, series):
+                written.append(series)
+
+        sink = ListBufferSink(max_buffer=1)
+        feed = SensorFeed([ConstantSensor(name='metrics_constant')], [sink],
+                          0.05)
+        feed.start_sensors()
+        try:
+            count = 0
+            while count < 2:
+                count += feed.process_pending(timeout=1)
+        finally:
+            feed.stop_sensors()
+        feed.finalise_sinks()
+
+        snapshot = metrics.REGISTRY.snapshot()
+        self.assertGreaterEqual(snapshot['sensor.metrics_constant.samples'], 2)
+        self.assertGreaterEqual(
+            snapshot['sensor.metrics_constant.read_seconds']['count'], 2)
+        self.assertEqual(snapshot['sensor.metrics_constant.overruns'], 0)
+        self.assertGreaterEqual(snapshot['feed.batch_size']['count'], 1)
+        self.assertGreaterEqual(
+            snapshot['sink.ListBufferSink.process_seconds']['count'], 1)
+        self.assertEqual(snapshot['sink.ListBufferSink.flush_size']['count'],
+                         len(written))
+
+    def test_sinks_of_same_class(self):
+        class CountingSink(Sink):
+            pass
+
+        first, second = CountingSink(), CountingSink()
+        self.assertNotEqual(first.metrics_name, second.metrics_name)
+        self.assertEqual(first.metrics_name, first.metrics_name)
+        workers = [SinkWorker(first), SinkWorker(second)]
+        workers[0].dropped = 3
+        snapshot = metrics.REGISTRY.snapshot()
+        self.assertEqual(snapshot[first.metrics_name + '.dropped'], 3)
+        self.assertEqual(snapshot[second.metrics_name + '.dropped'], 0)
+
+    def test_devices_of_same_name(self):
+        first, second = DummyMultiSensor(), DummyMultiSensor()
+        self.assertNotEqual(first.metrics_name, second.metrics_name)
+        self.assertEqual(first.metrics_name, first.metrics_name)
+        jobs = [first.get_job(1), second.get_job(1)]
+        jobs[0](0)
+        snapshot = metrics.REGISTRY.snapshot()
+        self.assertEqual(snapshot[first.metrics_name + '.reads'], 1)
+        self.assertEqual(snapshot[second.metrics_name + '.reads'], 0)
@@ -0,0 +1,160 @@
+"""Tests for sensor_feed.scheduler."""
+from queue import Queue
+import threading
+import time
+import unittest
+
+from sensor_feed.scheduler import Scheduler, Ticker, run_periodic
+from sensor_feed.sensor_multi import DummyMultiSensor
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = Scheduler(max_workers=2)
+        self.scheduler.start()
+
+    def tearDown(self):
+        self.scheduler.stop()
+
+    def test_many_jobs_few_threads(self):
+        calls = []
+        before = threading.active_count()
+        jobs = [self.scheduler.add(calls.append, Ticker(0.1), str(num))
+                for num in range(20)]
+        time.sleep(0.35)
+        # one scheduling thread plus at most max_workers workers
+        self.assertLessEqual(threading.active_count() - before, 2)
+        for job in jobs:
+            self.scheduler.remove(job)
+        count = len(calls)
+        self.assertGreaterEqual(count, 60)
+        time.sleep(0.2)
+        self.assertEqual(len(calls), count)
+
+    def test_failing_job_retried(self):
+        def fail(trigger_time):
+            raise IOError('I2C bus error')
+        ticker = Ticker(0.05)
+        with self.assertLogs('sensor_feed.scheduler', 'ERROR'):
+            job = self.scheduler.add(fail, ticker, 'flaky')
+            time.sleep(0.2)
+        self.scheduler.remove(job)
+        self.assertGreaterEqual(ticker.errors, 2)
+
+    def test_failing_job_removed(self):
+        def fail(trigger_time):
+            raise IOError('I2C bus error')
+        ticker = Ticker(0.1, overrun='raise')
+        with self.assertLogs('sensor_feed.scheduler', 'ERROR'):
+            job = self.scheduler.add(fail, ticker, 'broken')
+            time.sleep(0.2)
+        self.assertTrue(job.cancelled)
+        self.assertEqual(ticker.errors, 1)
+
+    def test_failing_thread_retried(self):
+        calls = []
+
+        def flaky(trigger_time):
+            calls.append(trigger_time)
+            if len(calls) == 1:
+                raise IOError('I2C bus error')
+        shutdown = threading.Event()
+        ticker = Ticker(0.05)
+        thread = threading.Thread(target=run_periodic,
+                                  args=(flaky, ticker, shutdown))
+        with self.assertLogs('sensor_feed.scheduler', 'ERROR'):
+            thread.start()
+            time.sleep(0.2)
+        shutdown.set()
+        thread.join()
+        self.assertEqual(ticker.errors, 1)
+        self.assertGreaterEqual(len(calls), 3)
+
+    def test_multi_sensor(self):
+        device = DummyMultiSensor()
+        queues = [Queue(), Queue()]
+        for child, queue in zip(device.get_sensors(), queues):
+            child.start(queue, 0.1, self.scheduler)
+        time.sleep(0.35)
+        for child in device.get_sensors():
+            child.stop(join=False)
+        for child in device.get_sensors():
+            child.stop()
+        self.assertIsNone(device.current_job)
+        self.assertGreaterEqual(queues[0].qsize(), 3)
+        self.assertEqual(queues[0].get()[1], 1.2)
+        self.assertEqual(queues[1].get()[1], 5.4)
+
+
+class TickerTestCase(unittest.TestCase):
+    def test_aligned(self):
+        ticker = Ticker(0.05, aligned=True)
+        stamps = []
+        for _ in range(5):
+            time.sleep(max(ticker.delay(), 0))
+            stamps.append(ticker.tick())
+            ticker.advance()
+        for stamp in stamps:
+            self.assertEqual(stamp % 50000000, 0)
+        self.assertEqual(stamps[-1] - stamps[0], 200000000)
+
+    def test_aligned_fractional_nanos(self):
+        # a period that isn't a whole number of nanoseconds
+        ticker = Ticker(1 / 30, aligned=True)
+        time.sleep(max(ticker.delay(), 0))
+        stamp = ticker.tick()
+        self.assertLess(abs(stamp - time.time_ns()), 10000000)
+
+    def test_clock_step(self):
+        ticker = Ticker(0.05, aligned=True)
+        # as if the clock was stepped an hour forward after starting
+        ticker._wall_offset -= 3600
+        ticker.tick()
+        with self.assertLogs('sensor_feed.scheduler', 'WARNING'):
+            ticker.advance()
+        self.assertEqual(ticker.overruns, 0)
+        stamp = ticker.tick()
+        self.assertEqual(stamp % 50000000, 0)
+        self.assertLess(abs(stamp - time.time_ns()), 100000000)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            Ticker(1, overrun='panic')
+
+    def test_raise(self):
+        ticker = Ticker(0.01, overrun='raise')
+        ticker.tick()
+        time.sleep(0.02)
+        with self.assertRaises(RuntimeError):
+            ticker.advance()
+        self.assertEqual(ticker.overruns, 1)
+
+    def test_skip(self):
+        ticker = Ticker(0.05, aligned=True, overrun='skip')
+        time.sleep(max(ticker.delay(), 0))
+        first = ticker.tick()
+        time.sleep(0.12)
+        ticker.advance()
+        self.assertEqual(ticker.overruns, 1)
+        self.assertGreater(ticker.delay(), 0)
+        self.assertEqual(ticker.tick() - first, 150000000)
+
+    def test_immediate(self):
+        ticker = Ticker(0.05, overrun='immediate')
+        ticker.tick()
+        time.sleep(0.12)
+        ticker.advance()
+        self.assertEqual(ticker.overruns, 1)
+        self.assertLessEqual(ticker.delay(), 0)
+
+    def test_stretch(self):
+        ticker = Ticker(0.05, overrun='stretch')
+        ticker.tick()
+        time.sleep(0.12)
+        with self.assertLogs('sensor_feed.scheduler', 'WARNING'):
+            ticker.advance()
+        self.assertEqual(ticker.overruns, 1)
+        self.assertAlmostEqual(ticker.period, 0.15)
+        ticker.tick()
+        ticker.advance()
+        self.assertAlmostEqual(ticker.period, 0.1)
@@ -1,17 +1,71 @@
 """Tests for sensor_feed.sensor."""
+import os
 from queue import Queue
+import tempfile
 import unittest
 import time
 
-from sensor_feed.sensor import DummySensor
+from sensor_feed.scheduler import Scheduler
+from sensor_feed.sensor import ConstantSensor, CpuLoadTracker
+from sensor_feed.sensor_cpu import CpuCoreLoad
 
 
 class SensorTestCase(unittest.TestCase):
     def test_sensor(self):
-        sens = DummySensor()
+        sens = ConstantSensor()
         queue = Queue()
         sens.start(queue, 0.5)
         time.sleep(4)
         sens.stop()
         self.assertTrue(queue.qsize() >= 6)
         self.assertTrue(queue.qsize() <= 10)
+
+    def test_scheduled_sensor(self):
+        scheduler = Scheduler(max_workers=1)
+        scheduler.start()
+        sens = ConstantSensor()
+        queue = Queue()
+        sens.start(queue, 0.5, scheduler)
+        time.sleep(4)
+        sens.stop()
+        scheduler.stop()
+        self.assertIsNone(sens.current_thread)
+        self.assertTrue(queue.qsize() >= 6)
+        self.assertTrue(queue.qsize() <= 10)
+
+
+class CpuLoadTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.fname = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.fname)
+
+    def write_stat(self, *lines):
+        with open(self.fname, 'w') as stat:
+            for line in lines:
+                stat.write(line + '\n')
+            stat.write('intr 1 2 3\n')
+
+    def test_tracker(self):
+        self.write_stat('cpu  10 0 10 80 5', 'cpu0 10 0 10 80 5')
+        tracker = CpuLoadTracker(self.fname)
+        self.assertEqual(tracker.update(), {'cpu': 0.2, 'cpu0': 0.2})
+
+        self.write_stat('cpu  40 0 20 140 5', 'cpu0 40 0 20 140 5')
+        self.assertEqual(tracker.update()['cpu'], 0.4)
+
+        # no time passed, previous value is kept
+        self.assertEqual(tracker.update()['cpu'], 0.4)
+
+    def test_core_load(self):
+        self.write_stat('cpu  10 0 10 80', 'cpu0 10 0 0 90', 'cpu1 0 0 10 90')
+        device = CpuCoreLoad(fname=self.fname)
+        self.assertEqual([sens.param_name for sens in device.get_sensors()],
+                         ['cpu', 'cpu0', 'cpu1'])
+        queues = [Queue() for _ in device.get_sensors()]
+        for sens, queue in zip(device.get_sensors(), queues):
+            device.queues[sens] = queue
+        device.enqueue_values(0)
+        self.assertEqual([queue.get()[1] for queue in queues], [0.2, 0.1, 0.1])
@@ -1,8 +1,16 @@
 """Tests for the sinks code."""
 from datetime import datetime
+import json
+import os
+from queue import Queue
+import shutil
+import tempfile
+import time
 import unittest
+from unittest import mock
 
 from sensor_feed import sink
+from sensor_feed.record import Sample
 
 
 class SinkTestCase(unittest.TestCase):
@@ -28,3 +36,310 @@ class SinkTestCase(unittest.TestCase):
 
         expected = sink.np.datetime64('2016-03-05T00:00:00.0')
         self.assertEqual(sink.round_datetime(dt1, 'D'), expected)
+
+    @unittest.skipIf(sink.NO_PANDAS, 'pandas/numpy not installed')
+    def test_round_timestamps(self):
+        stamps = sink.np.array([
+            '2016-03-05T04:53:43.000032',
+            '2016-03-05T04:53:43.5',
+            '2016-03-05T04:53:44.5',
+            '2016-03-05T04:53:43.500001',
+        ], dtype='datetime64[ns]')
+        expected = sink.np.array([
+            '2016-03-05T04:53:43',
+            '2016-03-05T04:53:44',
+            '2016-03-05T04:53:44',
+            '2016-03-05T04:53:44',
+        ], dtype='datetime64[ns]')
+        sink.np.testing.assert_array_equal(
+            sink.round_timestamps(stamps, 's'), expected)
+        sink.np.testing.assert_array_equal(
+            sink.round_timestamps(stamps.view('i8'), 's'), expected)
+
+    @unittest.skipIf(sink.NO_PANDAS, 'pandas/numpy not installed')
+    @unittest.skipUnless(hasattr(time, 'tzset'), 'time.tzset not available')
+    def test_to_series_local(self):
+        def set_tz(zone):
+            if zone is None:
+                os.environ.pop('TZ', None)
+            else:
+                os.environ['TZ'] = zone
+            time.tzset()
+        self.addCleanup(set_tz, os.environ.get('TZ'))
+        set_tz('Australia/Sydney')
+
+        # 2016-03-05 04:53:43 UTC
+        stamp = 1457153623 * 10**9
+        series = sink.to_series([stamp], [1.])
+        # naive local time, as written before readings were timestamped
+        # in nanoseconds
+        self.assertIsNone(series.index.tz)
+        self.assertEqual(series.index[0], datetime(2016, 3, 5, 15, 53, 43))
+        series = sink.to_series([stamp], [1.], tz='UTC')
+        self.assertEqual(series.index.asi8[0], stamp)
+        self.assertEqual(str(series.index.tz), 'UTC')
+
+    @unittest.skipIf(sink.NO_PANDAS, 'pandas/numpy not installed')
+    def test_buffered_sink_batch(self):
+        written = []
+
+        class ListBufferSink(sink.BufferedSink):
+            def write_buffer(self, param_name, series):
+                written.append((param_name, series))
+
+        buf = ListBufferSink(max_buffer=3)
+        buf.process_batch([
+            Sample.from_value('a', datetime(2016, 3, 5, 4, 53, sec), float(sec))
+            for sec in range(5)
+        ] + [Sample.from_value('b', datetime(2016, 3, 5, 4, 53, 0), 1.0)])
+        self.assertEqual(len(written), 1)
+        self.assertEqual(written[0][0], 'a')
+        self.assertEqual(list(written[0][1].values), [0., 1., 2., 3.])
+
+        buf.finalise()
+        self.assertEqual([name for name, _ in written], ['a', 'a', 'b'])
+        self.assertEqual(list(written[1][1].values), [4.])
+
+    @unittest.skipIf(sink.NO_PANDAS, 'pandas/numpy not installed')
+    def test_buffered_sink_dtype(self):
+        written = []
+
+        class ListBufferSink(sink.BufferedSink):
+            def write_buffer(self, param_name, series):
+                written.append(series)
+
+        class IntSensor:
+            param_name = 'count'
+            dtype = int
+
+        buf = ListBufferSink(max_buffer=1)
+        buf.initialise([IntSensor()])
+        buf.process_value('count', datetime(2016, 3, 5, 4, 53, 0), 1)
+        buf.process_value('count', datetime(2016, 3, 5, 4, 53, 0, 600000), 2)
+        self.assertEqual(written[0].dtype, sink.np.int64)
+        self.assertEqual(list(written[0].values), [1, 2])
+
+    @unittest.skipIf(sink.NO_PANDAS, 'pandas/numpy not installed')
+    def test_buffered_sink_max_age(self):
+        written = Queue()
+
+        class ListBufferSink(sink.BufferedSink):
+            def write_buffer(self, param_name, series):
+                written.put((param_name, list(series.values)))
+
+        buf = ListBufferSink(max_age=0.1, check_period=0.02)
+        buf.initialise([])
+        buf.process_value('a', datetime(2016, 3, 5, 4, 53, 0), 1.0)
+        # written by the timer without any more data arriving
+        self.assertEqual(written.get(timeout=1), ('a', [1.0]))
+        buf.finalise()
+        self.assertTrue(written.empty())
+
+    @unittest.skipIf(sink.NO_PANDAS, 'pandas/numpy not installed')
+    def test_buffered_sink_max_bytes(self):
+        written = []
+
+        class ListBufferSink(sink.BufferedSink):
+            def write_buffer(self, param_name, series):
+                written.append((param_name, list(series.values)))
+
+        # 16 bytes per float value
+        buf = ListBufferSink(max_bytes=40)
+        buf.process_batch([
+            Sample.from_value('a', datetime(2016, 3, 5, 4, 53, 0), 1.0),
+            Sample.from_value('b', datetime(2016, 3, 5, 4, 53, 0), 2.0),
+        ])
+        self.assertEqual(written, [])
+        self.assertEqual(buf.nbytes, 32)
+        buf.process_value('a', datetime(2016, 3, 5, 4, 53, 1), 3.0)
+        self.assertEqual(written, [('a', [1.0, 3.0]), ('b', [2.0])])
+        self.assertEqual(buf.nbytes, 0)
+
+    @unittest.skipIf(sink.NO_PANDAS, 'pandas/numpy not installed')
+    def test_dataframe_sink_batch(self):
+        dfsink = sink.DataFrameSink()
+        dfsink.process_batch([
+            Sample.from_value('a', datetime(2016, 3, 5, 4, 53, 0), 1.0),
+            Sample.from_value('b', datetime(2016, 3, 5, 4, 53, 0), 2.0),
+            Sample.from_value('a', datetime(2016, 3, 5, 4, 53, 1), 3.0),
+        ])
+        dfsink.process_value('a', datetime(2016, 3, 5, 4, 53, 1), 4.0)
+        self.assertEqual(list(dfsink.df['a'].values), [1.0, 4.0])
+        self.assertEqual(dfsink.df['b'].iloc[0], 2.0)
+
+
+class FakeMessageInfo:
+    def __init__(self, rc, mid=0):
+        self.rc = rc
+        self.mid = mid
+
+
+class FakeClient:
+    """
+        Stands in for paho's client and a broker, publishing to a list.
+
+        The broker can be taken offline and brought back online. If
+        ``acking`` is False QoS 1 and 2 messages are held unacknowledged
+        until the broker next comes online.
+    """
+    def __init__(self):
+        self.published = []
+        self.unacked = []
+        self.on_publish = None
+        self.on_connect = None
+        self.on_disconnect = None
+        self.max_queued = 0
+        self.online = True
+        self.acking = True
+        self._mid = 0
+
+    def max_queued_messages_set(self, max_queued):
+        self.max_queued = max_queued
+
+    def connect(self, broker, port, keepalive):
+        pass
+
+    def connect_async(self, broker, port, keepalive):
+        if self.online:
+            self.on_connect(self, None, {}, 0)
+
+    def go_offline(self):
+        self.online = False
+        self.on_disconnect(self, None, 1)
+
+    def go_online(self):
+        self.online = True
+        self.on_connect(self, None, {}, 0)
+        unacked, self.unacked = self.unacked, []
+        for mid, message in unacked:
+            self.published.append(message)
+            self.on_publish(self, None, mid)
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def publish(self, topic, payload, qos=0):
+        self._mid += 1
+        if self.online and (qos == 0 or self.acking):
+            self.published.append((topic, payload, qos))
+            self.on_publish(self, None, self._mid)
+            return FakeMessageInfo(sink.mqtt.MQTT_ERR_SUCCESS, self._mid)
+        if qos > 0:
+            # paho keeps QoS 1 and 2 messages to (re)send once connected
+            self.unacked.append((self._mid, (topic, payload, qos)))
+            if self.online:
+                return FakeMessageInfo(sink.mqtt.MQTT_ERR_SUCCESS, self._mid)
+            return FakeMessageInfo(sink.mqtt.MQTT_ERR_NO_CONN, self._mid)
+        return FakeMessageInfo(sink.mqtt.MQTT_ERR_NO_CONN, self._mid)
+
+
+class MQTTSinkTestCase(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(sink.mqtt, 'Client', FakeClient)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.samples = [
+            Sample.from_value('a', 1000, 1.0),
+            Sample.from_value('b', 1000, 2.0),
+            Sample.from_value('a', 2000, 3.0),
+        ]
+
+    def test_publish(self):
+        mqttsink = sink.MQTTSink('broker', 'root', qos=1)
+        mqttsink.process_batch(self.samples)
+        self.assertEqual(mqttsink.client.published, [
+            ('root/a', 1.0, 1), ('root/b', 2.0, 1), ('root/a', 3.0, 1),
+        ])
+
+    def test_bounded(self):
+        mqttsink = sink.MQTTSink('broker', 'root', max_queued=2)
+        # nothing is sent until the network loop runs
+        mqttsink.client.on_publish = lambda *args: None
+        mqttsink.process_batch(self.samples)
+        self.assertEqual(len(mqttsink.client.published), 2)
+        self.assertEqual(mqttsink.dropped, 1)
+
+        mqttsink._on_publish(None, None, 1)
+        mqttsink._on_publish(None, None, 2)
+        mqttsink.process_batch(self.samples)
+        self.assertEqual(len(mqttsink.client.published), 4)
+
+    def test_disconnect_with_outstanding(self):
+        mqttsink = sink.MQTTSink('broker', 'root', max_queued=2)
+        mqttsink.client.on_publish = lambda *args: None
+        mqttsink.process_batch(self.samples)
+        self.assertEqual(mqttsink.dropped, 1)
+        # paho discards the unsent messages on reconnecting
+        mqttsink.client.go_offline()
+        mqttsink.client.go_online()
+        mqttsink.process_batch(self.samples[:2])
+        self.assertEqual(len(mqttsink.client.published), 4)
+        self.assertEqual(mqttsink.dropped, 1)
+
+    def test_qos1_offline(self):
+        mqttsink = sink.MQTTSink('broker', 'root', qos=1)
+        mqttsink.client.acking = False
+        mqttsink.process_batch(self.samples[:1])
+        # paho keeps QoS 1 messages over a disconnection and resends them
+        mqttsink.client.go_offline()
+        mqttsink.process_batch(self.samples[1:])
+        self.assertEqual(mqttsink.dropped, 0)
+        self.assertEqual(mqttsink._pending(), 3)
+        mqttsink.client.go_online()
+        self.assertEqual(len(mqttsink.client.published), 3)
+        self.assertEqual(mqttsink._pending(), 0)
+        self.assertEqual(mqttsink._early, set())
+
+    def test_published_before_tracked(self):
+        mqttsink = sink.MQTTSink('broker', 'root', max_queued=2)
+        # the network loop may send a message before publish() returns
+        mqttsink.process_batch(self.samples)
+        self.assertEqual(mqttsink._pending(), 0)
+        self.assertEqual(mqttsink.dropped, 0)
+
+    def test_spool(self):
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir)
+        mqttsink = sink.MQTTSink('broker', 'root', spool_dir=spool_dir,
+                                 replay_rate=1000, replay_batch=2)
+        try:
+            mqttsink.process_batch(self.samples[:1])
+            mqttsink.client.go_offline()
+            mqttsink.process_batch(self.samples[1:])
+            self.assertEqual(len(mqttsink.client.published), 1)
+            self.assertEqual(mqttsink.spooled, 2)
+
+            mqttsink.client.go_online()
+            for _ in range(50):
+                if len(mqttsink.client.published) == 3:
+                    break
+                time.sleep(0.01)
+        finally:
+            mqttsink.finalise()
+        self.assertEqual(mqttsink.client.published, [
+            ('root/a', 1.0, 0), ('root/b', b'2.0', 0), ('root/a', b'3.0', 0),
+        ])
+        self.assertEqual(mqttsink.dropped, 0)
+
+    def test_pack_json(self):
+        mqttsink = sink.MQTTSink('broker', 'root', pack='json')
+        mqttsink.process_batch(self.samples)
+        topic, payload, _ = mqttsink.client.published[0]
+        self.assertEqual(topic, 'root/a')
+        self.assertEqual(json.loads(payload),
+                         {'ts': [1000, 2000], 'value': [1.0, 3.0]})
+        self.assertEqual(len(mqttsink.client.published), 2)
+
+    @unittest.skipIf(sink.NO_CBOR, 'cbor2 not installed')
+    def test_pack_cbor(self):
+        mqttsink = sink.MQTTSink('broker', 'root', pack='cbor')
+        mqttsink.process_batch(self.samples)
+        _, payload, _ = mqttsink.client.published[1]
+        self.assertEqual(sink.cbor2.loads(payload),
+                         {'ts': [1000], 'value': [2.0]})
@@ -0,0 +1,98 @@
+"""Tests for the Parquet sink."""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from sensor_feed.record import Sample
+
+try:
+    import pyarrow.parquet as pq
+    from sensor_feed.sink_parquet import ParquetSink, DAY_NANOS
+    NO_PYARROW = False
+except ImportError:
+    NO_PYARROW = True
+
+
+@unittest.skipIf(NO_PYARROW, 'pyarrow not installed')
+class ParquetSinkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def files(self):
+        return sorted(
+            os.path.relpath(os.path.join(path, name), self.directory)
+            for path, _, names in os.walk(self.directory) for name in names
+        )
+
+    def test_partitions(self):
+        sink = ParquetSink(self.directory, max_buffer=4, compression='zstd')
+        # 2016-03-05 23:59:58 UTC
+        start = 1457222398 * 10**9
+        sink.process_batch([
+            Sample.from_value(name, start + sec * 10**9, float(sec))
+            for sec in range(7) for name in ('temp', 'humidity')
+        ])
+        sink.finalise()
+
+        self.assertEqual(self.files(), [
+            'param=humidity/date=2016-03-05/part-%d.parquet' % start,
+            'param=humidity/date=2016-03-06/part-%d.parquet' % (start + 2 * 10**9),
+            'param=temp/date=2016-03-05/part-%d.parquet' % start,
+            'param=temp/date=2016-03-06/part-%d.parquet' % (start + 2 * 10**9),
+        ])
+
+        table = pq.read_table(os.path.join(
+            self.directory, 'param=temp/date=2016-03-06',
+            'part-%d.parquet' % (start + 2 * 10**9)
+        ))
+        self.assertEqual(table.column_names, ['ts', 'param', 'value'])
+        self.assertTrue(str(table.schema.field('param').type).startswith('dictionary'))
+        self.assertEqual(table.column('value').to_pylist(), [2., 3., 4., 5., 6.])
+        metadata = pq.ParquetFile(os.path.join(
+            self.directory, 'param=temp/date=2016-03-06',
+            'part-%d.parquet' % (start + 2 * 10**9)
+        )).metadata
+        # one row group per buffer written (the full buffer and finalise)
+        self.assertEqual(metadata.num_row_groups, 2)
+        self.assertEqual(metadata.row_group(0).column(0).compression, 'ZSTD')
+
+    def test_rows_per_file(self):
+        sink = ParquetSink(self.directory, max_buffer=1, rows_per_file=4)
+        start = 10 * DAY_NANOS
+        sink.process_batch([
+            Sample.from_value('temp', start + sec * 10**9, float(sec))
+            for sec in range(10)
+        ])
+        sink.finalise()
+
+        files = self.files()
+        self.assertEqual(len(files), 3)
+        rows = [pq.read_metadata(os.path.join(self.directory, name)).num_rows
+                for name in files]
+        self.assertEqual(sorted(rows), [2, 4, 4])
+
+    def test_max_file_age(self):
+        sink = ParquetSink(self.directory, max_buffer=1, max_age=0.05,
+                           max_file_age=0.1)
+        sink.initialise([])
+        start = 10 * DAY_NANOS
+        try:
+            sink.process_batch([Sample.from_value('temp', start, 1.)])
+            for _ in range(100):
+                if self.files() and not sink._files:
+                    break
+                time.sleep(0.01)
+            # closed by the timer, so readable without more data
+            self.assertEqual(sink._files, {})
+            files = self.files()
+            self.assertEqual(len(files), 1)
+            self.assertEqual(pq.read_metadata(
+                os.path.join(self.directory, files[0])).num_rows, 1)
+
+            sink.process_batch([Sample.from_value('temp', start + 10**9, 2.)])
+        finally:
+            sink.finalise()
+        self.assertEqual(len(self.files()), 2)
@@ -0,0 +1,148 @@
+"""Tests for the PhilDB sink."""
+import shutil
+import tempfile
+import threading
+import unittest
+
+from sensor_feed.aggregate import AggregatingSink
+from sensor_feed.record import Sample
+from sensor_feed.sensor import ConstantSensor
+
+try:
+    from sensor_feed.sink_phildb import PhilDBSink
+    NO_PHILDB = False
+except ImportError:
+    NO_PHILDB = True
+
+
+@unittest.skipIf(NO_PHILDB, 'phildb not installed')
+class PhilDBSinkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.dbfile = self.directory + '/db'
+
+    def record_writes(self, sink):
+        written = {}
+
+        def recording_write(param_name, freq, series, **kwargs):
+            written[param_name] = (freq, series)
+
+        sink.db.write = recording_write
+        return written
+
+    def test_write(self):
+        sink = PhilDBSink(self.dbfile, max_buffer=4)
+        registered = []
+        written = []
+        add_measurand = sink.db.add_measurand
+
+        def counting_add_measurand(*args):
+            registered.append(args)
+            return add_measurand(*args)
+
+        def recording_write(param_name, freq, series, **kwargs):
+            written.append((param_name, freq, list(series.values),
+                            threading.current_thread().name))
+
+        sink.db.add_measurand = counting_add_measurand
+        sink.db.write = recording_write
+
+        start = 1457153623 * 10**9
+        sink.process_batch([
+            Sample.from_value('phildb_temp', start + sec * 10**9, float(sec))
+            for sec in range(10)
+        ])
+        sink.finalise()
+
+        self.assertEqual(len(registered), 1)
+        self.assertEqual(written, [
+            ('phildb_temp', 'S', [0., 1., 2., 3., 4.], 'phildb-writer'),
+            ('phildb_temp', 'S', [5., 6., 7., 8., 9.], 'phildb-writer'),
+        ])
+
+    def test_sensor_freq(self):
+        sink = PhilDBSink(self.dbfile, max_buffer=10, tz='UTC')
+        written = self.record_writes(sink)
+        fast = ConstantSensor(name='fast')
+        fast.period = 1
+        slow = ConstantSensor(name='slow')
+        slow.period = 60
+        for sensor in (fast, slow):
+            sensor.aligned = True
+        sink.initialise([fast, slow])
+
+        start = 1457153640 * 10**9
+        sink.process_batch([
+            Sample.from_value('fast', start + 10**9 + 10**6, 1.),
+            # 2 seconds late, so a gap
+            Sample.from_value('fast', start + 4 * 10**9, 2.),
+            Sample.from_value('slow', start + 10**8, 3.),
+        ])
+        sink.finalise()
+
+        freq, series = written['fast']
+        self.assertEqual(freq, 'S')
+        self.assertEqual(list(series.index.asi8),
+                         [start + sec * 10**9 for sec in range(1, 5)])
+        self.assertEqual(list(series.isnull()), [False, True, True, False])
+        freq, series = written['slow']
+        self.assertEqual(freq, 'T')
+        self.assertEqual(list(series.index.asi8), [start])
+        self.assertEqual(sink.collisions, 0)
+
+    def test_unaligned(self):
+        sink = PhilDBSink(self.dbfile)
+        sensor = ConstantSensor(name='unaligned')
+        sensor.period = 1
+        try:
+            with self.assertLogs('sensor_feed.sink_phildb', 'WARNING'):
+                sink.initialise([sensor])
+            self.assertEqual(sink._freqs, {'unaligned': 'S'})
+        finally:
+            sink.finalise()
+
+    def test_aggregated(self):
+        sink = AggregatingSink(PhilDBSink(self.dbfile), window=60,
+                               stats=['mean'])
+        written = self.record_writes(sink.sink)
+        sensor = ConstantSensor(name='windowed')
+        with self.assertNoLogs('sensor_feed.sink_phildb', 'WARNING'):
+            sink.initialise([sensor])
+        start = 1457153640 * 10**9
+        sink.process_batch([
+            Sample.from_value('windowed', start + sec * 10**9, float(sec))
+            for sec in range(0, 130, 10)
+        ])
+        sink.finalise()
+        freq, series = written['windowed_mean']
+        self.assertEqual(freq, 'T')
+        self.assertEqual(len(series), 3)
+
+    def test_collisions(self):
+        sink = PhilDBSink(self.dbfile, max_buffer=10)
+        written = self.record_writes(sink)
+        sensor = ConstantSensor(name='jittery')
+        sensor.period = 60
+        sensor.aligned = True
+        sink.initialise([sensor])
+
+        start = 1457153640 * 10**9
+        sink.process_batch([
+            Sample.from_value('jittery', start + 10 * 10**9, 1.),
+            Sample.from_value('jittery', start + 20 * 10**9, 2.),
+        ])
+        with self.assertLogs('sensor_feed.sink_phildb', 'WARNING'):
+            sink.finalise()
+        self.assertEqual(sink.collisions, 1)
+        self.assertEqual(list(written['jittery'][1]), [2.])
+
+    def test_unknown_freq(self):
+        sink = PhilDBSink(self.dbfile, max_buffer=10)
+        written = self.record_writes(sink)
+        start = 1457153640 * 10**9
+        sink.process_batch([Sample.from_value('unknown', start, 1.)])
+        # a single value has no frequency, so is dropped rather than raising
+        with self.assertLogs('sensor_feed.sink_phildb', 'ERROR'):
+            sink.finalise()
+        self.assertEqual(written, {})
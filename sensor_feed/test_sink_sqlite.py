@@ -0,0 +1,95 @@
+"""Tests for the SQLite sink."""
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from sensor_feed.record import Sample
+from sensor_feed.sensor import ConstantSensor
+from sensor_feed.sink_sqlite import SQLiteSink
+
+
+class SQLiteSinkTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.dbfile = directory + '/feed.db'
+
+    def count(self):
+        conn = sqlite3.connect(self.dbfile)
+        try:
+            return conn.execute('SELECT count(*) FROM reading').fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_write(self):
+        sink = SQLiteSink(self.dbfile, max_buffer=4)
+        sink.initialise([ConstantSensor(name='temp')])
+        self.assertEqual(sink.conn.execute('PRAGMA journal_mode').fetchone(),
+                         ('wal',))
+
+        start = 1457153623 * 10**9
+        sink.process_batch([
+            Sample.from_value(name, start + sec * 10**9, float(sec))
+            for sec in range(6) for name in ('temp', 'humidity')
+        ])
+        # a full buffer of each parameter is written straight away
+        self.assertEqual(self.count(), 10)
+        sink.finalise()
+
+        conn = sqlite3.connect(self.dbfile)
+        self.addCleanup(conn.close)
+        self.assertEqual(conn.execute('SELECT id, name FROM param').fetchall(),
+                         [(1, 'temp'), (2, 'humidity')])
+        self.assertEqual(
+            conn.execute('SELECT ts, value FROM reading WHERE param_id = 1 '
+                         'ORDER BY ts').fetchall(),
+            [(start + sec * 10**9, float(sec)) for sec in range(6)]
+        )
+        self.assertEqual(self.count(), 12)
+
+    def test_subsecond(self):
+        sink = SQLiteSink(self.dbfile, max_buffer=10)
+        start = 1457153623 * 10**9
+        sink.process_batch([
+            Sample.from_value('temp', start + tenth * 10**8, float(tenth))
+            for tenth in range(20)
+        ])
+        sink.finalise()
+        # every reading is kept at its full resolution
+        self.assertEqual(self.count(), 20)
+
+    def test_max_age(self):
+        sink = SQLiteSink(self.dbfile, max_age=0.05)
+        sink.initialise([ConstantSensor(name='temp')])
+        try:
+            sink.process_batch([Sample.from_value('temp', 1457153623 * 10**9,
+                                                  1.)])
+            for _ in range(50):
+                if self.count():
+                    break
+                time.sleep(0.01)
+            # a slow sensor's buffer reaches the database without more data
+            self.assertEqual(self.count(), 1)
+        finally:
+            sink.finalise()
+
+    def test_reopen(self):
+        start = 1457153623 * 10**9
+        for value in (1., 2.):
+            sink = SQLiteSink(self.dbfile)
+            sink.process_batch([
+                Sample.from_value('temp', start, value),
+                Sample.from_value('humidity', start, value),
+            ])
+            sink.finalise()
+
+        conn = sqlite3.connect(self.dbfile)
+        self.addCleanup(conn.close)
+        # the same ids are used, the later value replacing the earlier
+        self.assertEqual(
+            conn.execute('SELECT name, value FROM reading JOIN param '
+                         'ON param.id = param_id ORDER BY name').fetchall(),
+            [('humidity', 2.), ('temp', 2.)]
+        )
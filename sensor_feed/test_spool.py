@@ -0,0 +1,89 @@
+"""Tests for sensor_feed.spool."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from sensor_feed.spool import Spool
+
+
+class SpoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_append_and_read(self):
+        spool = Spool(self.directory)
+        self.assertFalse(spool)
+        spool.append('a/b', 1.5)
+        spool.append('a/c', b'\x00\x01')
+        self.assertTrue(spool)
+
+        self.assertEqual(spool.peek(1), [('a/b', b'1.5')])
+        # nothing consumed so peeking again gets the same message
+        self.assertEqual(spool.peek(5), [('a/b', b'1.5'), ('a/c', b'\x00\x01')])
+        spool.consume(1)
+        self.assertEqual(spool.peek(5), [('a/c', b'\x00\x01')])
+        spool.consume(1)
+        self.assertFalse(spool)
+        self.assertEqual(spool.peek(5), [])
+        spool.close()
+
+    def test_segments(self):
+        spool = Spool(self.directory, segment_size=20)
+        for num in range(10):
+            spool.append('t', str(num))
+        self.assertGreater(len(os.listdir(self.directory)), 1)
+
+        values = []
+        while spool:
+            batch = spool.peek(3)
+            values += [payload for _, payload in batch]
+            spool.consume(len(batch))
+        self.assertEqual(values, [str(num).encode() for num in range(10)])
+        # consumed segments are removed
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        spool.close()
+
+    def test_reopen(self):
+        spool = Spool(self.directory)
+        spool.append('t', 'kept')
+        spool.close()
+
+        spool = Spool(self.directory)
+        spool.append('t', 'new')
+        self.assertEqual(spool.peek(5), [('t', b'kept')])
+        spool.consume(1)
+        self.assertEqual(spool.peek(5), [('t', b'new')])
+        spool.close()
+
+    def test_max_bytes(self):
+        spool = Spool(self.directory, segment_size=10, max_bytes=40)
+        for num in range(10):
+            spool.append('t', str(num))
+        values = []
+        while spool:
+            batch = spool.peek(10)
+            values += [payload for _, payload in batch]
+            spool.consume(len(batch))
+        self.assertLess(len(values), 10)
+        self.assertEqual(values[-1], b'9')
+        spool.close()
+
+    def test_drop_while_reading(self):
+        spool = Spool(self.directory, segment_size=20, max_bytes=40)
+        spool.append('t', '0')
+        spool.append('t', '1')
+        self.assertEqual(len(spool.peek(2)), 2)
+        # the segment being read is dropped before the batch is consumed
+        for num in range(2, 12):
+            spool.append('t', str(num))
+        spool.consume(2)
+        values = []
+        while spool:
+            batch = spool.peek(10)
+            values += [payload for _, payload in batch]
+            spool.consume(len(batch))
+        self.assertNotIn(b'0', values)
+        self.assertEqual(values[-1], b'11')
+        spool.close()